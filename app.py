@@ -19,13 +19,38 @@ G検定対策クイズアプリ（Streamlit）エントリーポイント。
 
 from __future__ import annotations
 
-import os
+import functools
+import hashlib
+import importlib.util
+import itertools
 import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 import streamlit as st
 
+from gtest_quiz.generation import (
+    DEFAULT_FALLBACK_MODELS,
+    DEFAULT_GENERATION_DEADLINE_SECONDS,
+    DEFAULT_MAX_OUTPUT_TOKENS,
+    DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    GENERATION_CONFIG,
+    TRANSIENT_RETRY_ATTEMPTS,
+    TRANSIENT_RETRY_BASE_SECONDS,
+    approx_prompt_tokens,
+    build_prompt,
+    build_question,
+    collect_stream_text,
+    is_quota_error,
+    is_transient_error,
+    parse_response_json,
+    usage_tokens,
+)
 from gtest_quiz.meta import MetaManager
 from gtest_quiz.models import SessionState, Question
 from gtest_quiz.question_bank import (
@@ -34,74 +59,184 @@ from gtest_quiz.question_bank import (
     pick_random_from_chapter,
     pick_random_question,
     get_question_by_id,
+    load_question_bank,
+    bank_mtime_ns,
 )
 from gtest_quiz.ui import render_quiz_page
 
 # ----------------------------------------------------------------------
-#  Streamlit の rerun 互換ラッパー
+#  Streamlit の rerun ラッパー
 # ----------------------------------------------------------------------
 def rerun() -> None:
     """
-    Streamlit 1.x 以降では st.rerun、それ以前では st.experimental_rerun。
-    両方に対応するための薄いラッパー。
+    st.rerun の薄いラッパー（requirements は streamlit>=1.32 なので
+    非推奨の st.experimental_rerun は使わない）。
     """
-    if hasattr(st, "rerun"):
-        st.rerun()
-    else:  # 古いバージョン向け
-        st.experimental_rerun()  # type: ignore[attr-defined]
+    st.rerun()
+
+
+# st.fragment（1.37+）/ st.experimental_fragment（1.33〜1.36）の互換デコレータ。
+# どちらも無いバージョンでは何もしない（通常どおりアプリ全体が再実行される）。
+_fragment: Any = (
+    getattr(st, "fragment", None)
+    or getattr(st, "experimental_fragment", None)
+    or (lambda func: func)
+)
 
 
-# google-generativeai は存在しない環境でも動くように、遅延インポート + フォールバック
-try:
-    import google.generativeai as genai  # type: ignore[import]
-    HAS_GEMINI = True
-except Exception:
-    genai = None  # type: ignore[assignment]
-    HAS_GEMINI = False
+# google-generativeai / toml は存在しない環境でも動くように optional に扱う。
+# どちらも import が重いため、起動時には読み込まず初回利用時まで遅延させる。
+
+
+@functools.lru_cache(maxsize=None)
+def _has(module_name: str) -> bool:
+    """
+    モジュールを実際には import せずに、利用可能かどうかだけを判定する。
+    インストール状況はプロセス中に変わらないので、結果はモジュール名ごとに保持する。
+    """
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
 
-# toml は config.toml が無くても動くように optional に扱う
-try:
-    import toml  # type: ignore[import]
-    HAS_TOML = True
-except Exception:
-    toml = None  # type: ignore[assignment]
-    HAS_TOML = False
+@functools.lru_cache(maxsize=None)
+def _get_genai() -> Any:
+    """
+    google.generativeai を初回利用時に import して返す（無ければ None）。
+    API キーが無い（オフラインのみの）場合は呼び出し側で先に判定し、import しない。
+    """
+    try:
+        import google.generativeai as genai  # type: ignore[import]
+    except Exception:
+        return None
+    return genai
 
 
 # ----------------------------------------------------------------------
 #  アプリ設定読み込み
 # ----------------------------------------------------------------------
+CONFIG_PATH = "config.toml"
+
+
+def _config_mtime() -> float:
+    """config.toml の更新時刻（無ければ 0.0）。キャッシュのキーとして使う。"""
+    try:
+        return os.path.getmtime(CONFIG_PATH)
+    except OSError:
+        return 0.0
+
+
+@st.cache_resource(show_spinner=False)
+def _load_config_cached(mtime: float) -> Dict[str, Any]:
+    """
+    config.toml を 1 回だけパースしてプロセス全体で共有する。
+    mtime が変われば（ファイルが更新されれば）別キーとして読み直される。
+    """
+    cfg: Dict[str, Any] = {}
+
+    if _has("toml") and os.path.exists(CONFIG_PATH):
+        try:
+            import toml  # type: ignore[import]
+
+            cfg = toml.load(CONFIG_PATH)  # type: ignore[arg-type]
+        except Exception:
+            cfg = {}
+
+    return cfg
+
+
 def load_app_config() -> Dict[str, Any]:
     """
     ルート config.toml を読み込む。
     読み込みに失敗しても空 dict を返す。
     """
-    if "app_config" in st.session_state:
-        return st.session_state["app_config"]
+    return _load_config_cached(_config_mtime())
 
-    cfg: Dict[str, Any] = {}
-    path = "config.toml"
 
-    if HAS_TOML and os.path.exists(path):
+@st.cache_resource(show_spinner=False)
+def _quota_settings_cached(mtime: float) -> Dict[str, float]:
+    """config.toml の [quota] から、判定に使う数値を取り出して保持する。"""
+    near_ratio = 0.9
+    rpm = 15
+    qcfg = _load_config_cached(mtime).get("quota")
+    if isinstance(qcfg, dict):
         try:
-            cfg = toml.load(path)  # type: ignore[arg-type]
+            near_ratio = float(qcfg.get("near_limit_ratio", near_ratio))
         except Exception:
-            cfg = {}
+            near_ratio = 0.9
+        try:
+            rpm = int(qcfg.get("rpm", rpm))
+        except Exception:
+            rpm = 15
 
-    st.session_state["app_config"] = cfg
-    return cfg
+    return {"near_limit_ratio": near_ratio, "rpm": rpm}
+
+
+def get_quota_settings() -> Dict[str, float]:
+    """[quota] 設定（near_limit_ratio / rpm）を返す。"""
+    return _quota_settings_cached(_config_mtime())
+
+
+@st.cache_resource(show_spinner=False)
+def _gemini_settings_cached(mtime: float) -> Dict[str, Any]:
+    """config.toml の [gemini] から、API 呼び出しに使う数値を取り出して保持する。"""
+    timeout = DEFAULT_REQUEST_TIMEOUT_SECONDS
+    max_output_tokens = DEFAULT_MAX_OUTPUT_TOKENS
+    deadline = DEFAULT_GENERATION_DEADLINE_SECONDS
+    fallback_models = DEFAULT_FALLBACK_MODELS
+    gcfg = _load_config_cached(mtime).get("gemini")
+    if isinstance(gcfg, dict):
+        try:
+            timeout = float(gcfg.get("request_timeout", timeout))
+        except Exception:
+            timeout = DEFAULT_REQUEST_TIMEOUT_SECONDS
+        try:
+            max_output_tokens = int(gcfg.get("max_tokens_hint", max_output_tokens))
+        except Exception:
+            max_output_tokens = DEFAULT_MAX_OUTPUT_TOKENS
+        try:
+            deadline = float(gcfg.get("generation_deadline", deadline))
+        except Exception:
+            deadline = DEFAULT_GENERATION_DEADLINE_SECONDS
+        names = gcfg.get("fallback_models")
+        if isinstance(names, list):
+            fallback_models = tuple(n for n in names if isinstance(n, str) and n)
+    if timeout <= 0:
+        timeout = DEFAULT_REQUEST_TIMEOUT_SECONDS
+    if max_output_tokens <= 0:
+        max_output_tokens = DEFAULT_MAX_OUTPUT_TOKENS
+    if deadline <= 0:
+        deadline = DEFAULT_GENERATION_DEADLINE_SECONDS
+
+    return {
+        "request_timeout": timeout,
+        "max_output_tokens": max_output_tokens,
+        "generation_deadline": deadline,
+        "fallback_models": fallback_models,
+    }
+
+
+def get_gemini_settings() -> Dict[str, Any]:
+    """
+    [gemini] 設定（request_timeout / max_output_tokens /
+    generation_deadline / fallback_models）を返す。
+    """
+    return _gemini_settings_cached(_config_mtime())
 
 
 # ----------------------------------------------------------------------
 #  MetaManager / SessionState のラッパー
 # ----------------------------------------------------------------------
+@st.cache_resource(show_spinner=False)
 def get_meta_manager() -> MetaManager:
-    """MetaManager をセッションに保持して返す。"""
-    if "meta_manager" not in st.session_state:
-        mm = MetaManager("bank/meta.json")
-        mm.load()
-        st.session_state["meta_manager"] = mm
-    return st.session_state["meta_manager"]  # type: ignore[return-value]
+    """
+    MetaManager をプロセス全体で 1 つだけ生成して返す。
+    meta.json は全セッション共通なので、セッションごとに読み直さない。
+    """
+    mm = MetaManager("bank/meta.json")
+    mm.load()
+    return mm
 
 
 def get_session_state() -> SessionState:
@@ -121,6 +256,17 @@ def set_page(page: str) -> None:
     st.session_state["page"] = page
 
 
+def goto_page(page: str) -> None:
+    """
+    ページを切り替えて即座に再実行する（set_page + rerun）。
+    クイズ以外のページへ移るときは、次の問題の先読みを捨てる。
+    """
+    if page != "quiz":
+        _discard_prefetch()
+    set_page(page)
+    rerun()
+
+
 def get_page() -> str:
     return st.session_state.get("page", "home")
 
@@ -128,40 +274,133 @@ def get_page() -> str:
 # ----------------------------------------------------------------------
 #  Gemini 関連
 # ----------------------------------------------------------------------
-def init_gemini_if_needed() -> None:
-    """GEMINI_API_KEY があれば設定する（なければ何もしない）。"""
-    if not HAS_GEMINI:
-        return
+def _api_key_fingerprint() -> str:
+    """
+    GEMINI_API_KEY を識別する短いハッシュを返す（キーが無ければ空文字）。
+    キャッシュのキーに生の API キーを渡さないために使う。
+    """
+    api_key = os.getenv("GEMINI_API_KEY") or ""
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+@st.cache_resource(show_spinner=False)
+def _configure_gemini(key_fingerprint: str) -> bool:
+    """
+    genai.configure を API キーごとに 1 回だけ実行する（成功したら True）。
+    Streamlit の rerun のたびに SDK を再設定しないようにキャッシュする。
+    """
+    genai = _get_genai()
+    if genai is None:
+        return False
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
-        return
+        return False
     try:
         genai.configure(api_key=api_key)  # type: ignore[call-arg]
     except Exception:
         # APIキー不正などはあとでオンライン出題が失敗してオフラインへフォールバック
+        return False
+    return True
+
+
+def init_gemini_if_needed() -> None:
+    """GEMINI_API_KEY があれば設定する（なければ何もしない）。"""
+    key_fingerprint = _api_key_fingerprint()
+    if not key_fingerprint:
+        return
+    _configure_gemini(key_fingerprint)
+
+
+# モデル一覧のディスクキャッシュ（サーバー再起動後も list_models() を呼ばずに済ませる）
+MODELS_CACHE_PATH = Path("bank/models_cache.json")
+MODELS_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+def _read_models_cache(key_fingerprint: str) -> Optional[List[str]]:
+    """
+    ディスクキャッシュから、同じ API キーで 24 時間以内に取得したモデル一覧を返す。
+    無い・古い・壊れている場合は None。
+    """
+    try:
+        with MODELS_CACHE_PATH.open("r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") != key_fingerprint:
+            return None
+        if time.time() - float(cached.get("fetched_at", 0)) >= MODELS_CACHE_TTL_SECONDS:
+            return None
+        models = cached.get("models")
+    except (OSError, ValueError, TypeError, AttributeError):
+        return None
+    if not isinstance(models, list) or not all(isinstance(m, str) for m in models):
+        return None
+    return models
+
+
+def _write_models_cache(key_fingerprint: str, models: List[str]) -> None:
+    """モデル一覧をディスクキャッシュに書き出す（失敗しても無視する）。"""
+    payload = {"key": key_fingerprint, "fetched_at": time.time(), "models": models}
+    tmp_path = MODELS_CACHE_PATH.with_name(MODELS_CACHE_PATH.name + ".tmp")
+    try:
+        MODELS_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, MODELS_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def _clear_models_cache() -> None:
+    """モデル一覧のキャッシュ（メモリ・ディスクとも）を破棄する。"""
+    _fetch_gemini_models.clear()
+    _resolve_model.clear()
+    try:
+        MODELS_CACHE_PATH.unlink()
+    except OSError:
         pass
 
 
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def _fetch_gemini_models(key_fingerprint: str) -> List[str]:
+    """
+    genai.list_models() を呼び出す本体（24 時間キャッシュ）。
+    ディスクキャッシュが新しければ API は呼ばない。
+    失敗時は例外をそのまま投げ、空の結果をキャッシュしないようにする。
+    """
+    cached = _read_models_cache(key_fingerprint)
+    if cached is not None:
+        return cached
+
+    genai = _get_genai()
+    if genai is None:
+        return []
+
+    names: List[str] = []
+    for m in genai.list_models():  # type: ignore[call-arg]
+        methods = getattr(m, "supported_generation_methods", [])
+        if "generateContent" in methods:
+            names.append(m.name)
+    names.sort(reverse=True)
+    _write_models_cache(key_fingerprint, names)
+    return names
+
+
 def list_gemini_models() -> List[str]:
     """
     利用可能な Gemini モデル一覧を返す。
     generateContent に対応しているものだけを対象にし、名前逆ソート。
+    API キーごとに 24 時間キャッシュするので、毎回の出題で RPC は発生しない。
     """
-    if not HAS_GEMINI:
+    key_fingerprint = _api_key_fingerprint()
+    if not key_fingerprint or _get_genai() is None:
         return []
 
     try:
-        models = genai.list_models()  # type: ignore[call-arg]
+        return list(_fetch_gemini_models(key_fingerprint))
     except Exception:
         return []
 
-    names: List[str] = []
-    for m in models:
-        methods = getattr(m, "supported_generation_methods", [])
-        if "generateContent" in methods:
-            names.append(m.name)
-    return sorted(names, reverse=True)
-
 
 def get_preferred_model_name() -> Optional[str]:
     """
@@ -184,99 +423,159 @@ def get_preferred_model_name() -> Optional[str]:
     return None
 
 
-def choose_model_with_fallback() -> Optional[str]:
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def _resolve_model(preferred: Optional[str], key_fingerprint: str) -> Optional[str]:
     """
-    利用可能なモデル一覧から 1 つ選ぶ。
-    - preferred_model が利用可能ならそれ
-    - それ以外なら一覧の先頭（新しいとみなす）
-    - 1つもなければ None
+    優先モデル名とモデル一覧から、実際に使うモデル名を決める（24 時間キャッシュ）。
+    一覧の取得に失敗した場合は例外になり、結果はキャッシュされない。
     """
-    if not HAS_GEMINI:
-        return None
-
-    available = list_gemini_models()
+    available = _fetch_gemini_models(key_fingerprint)
     if not available:
         return None
 
-    preferred = get_preferred_model_name()
     if preferred and preferred in available:
         return preferred
 
     return available[0]
 
 
-def build_online_prompt(chapter_label: str, chapter_group: str) -> str:
-    """オンライン出題用プロンプト（auto_refill.py と同系統）。"""
-    return f"""
-あなたは日本語で G検定(JDLA Deep Learning for GENERAL) の高品質な四択問題を作る専門家です。
-
-以下の制約を厳密に守って、指定されたシラバス項目に対応する四択問題を 1 問だけ生成してください。
-
-# シラバス情報
-- 分野: {chapter_group}
-- 中項目: {chapter_label}
-
-# 出力条件
-- G検定本試験レベルの知識を問う。
-- 純粋な知識問題・概念理解問題・応用イメージ問題をバランス良く含める。
-- 選択肢は必ず 4 つ。紛らわしいが、1つだけ明確に正しい選択肢を含める。
-- 難易度は basic / standard / advanced のいずれか。
+def choose_model_with_fallback() -> Optional[str]:
+    """
+    利用可能なモデル一覧から 1 つ選ぶ。
+    - preferred_model が利用可能ならそれ
+    - それ以外なら一覧の先頭（新しいとみなす）
+    - 1つもなければ None
+    """
+    key_fingerprint = _api_key_fingerprint()
+    if not key_fingerprint or not _has("google.generativeai"):
+        return None
 
-# 出力フォーマット (JSON 1オブジェクトのみ)
-以下のキーを含む JSON オブジェクトとして出力してください:
+    try:
+        return _resolve_model(get_preferred_model_name(), key_fingerprint)
+    except Exception:
+        return None
 
-{{
-  "question": "問題文",
-  "choices": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"],
-  "correct_index": 0,
-  "explanation": "正解の理由と他の選択肢が誤りである理由を丁寧に解説する。",
-  "difficulty": "basic|standard|advanced"
-}}
 
-絶対に JSON 以外の文字列は出力しないでください。
-"""
+@st.cache_resource(show_spinner=False)
+def _get_model(key_fingerprint: str, model_name: str) -> Any:
+    """
+    genai.GenerativeModel を（API キー, モデル名）ごとに 1 つだけ作って使い回す。
+    内部のクライアント（HTTP/gRPC 接続）も再利用されるため、毎回の生成コストを省ける。
+    API キーが差し替えられたら、古いキーで設定されたモデルは使わずに作り直す。
+    応答は GENERATION_CONFIG の JSON スキーマに沿う形で返させる。
+    """
+    _configure_gemini(key_fingerprint)
+    genai = _get_genai()
+    return genai.GenerativeModel(  # type: ignore[union-attr]
+        model_name,
+        generation_config=GENERATION_CONFIG,
+    )
 
 
 def can_use_online(meta: MetaManager) -> bool:
     """
     オンライン出題を試みてよいかどうかを判定する。
     - GEMINI_API_KEY があるか
+    - 429 後のクールダウン中でないか
+    - 直近 1 分間の呼び出し回数（推定）が [quota].rpm 未満か
     - Quota の remaining_ratio が十分残っているか
     """
-    if not HAS_GEMINI:
+    if not _has("google.generativeai"):
         return False
     if not os.getenv("GEMINI_API_KEY"):
         return False
 
+    settings = get_quota_settings()
     quota = meta.get_quota_manager()
+    # 判定はすべて同じ時刻で行う（時計を 1 回だけ読む）
+    now = time.monotonic()
+    # 429 の retryDelay / 日次クォータ切れによるクールダウン中
+    if quota.is_blocked(now):
+        return False
+    if quota.is_rate_limited(int(settings["rpm"]), now):
+        return False
+
     remaining = quota.get_remaining_ratio()
     # まだ上限未推定なら一旦 OK、とする
     if remaining is None:
         return True
 
     # config.toml の [quota].near_limit_ratio を参照
-    cfg = load_app_config()
-    near_ratio = 0.9
-    qcfg = cfg.get("quota")
-    if isinstance(qcfg, dict):
-        r = qcfg.get("near_limit_ratio")
-        try:
-            near_ratio = float(r)
-        except Exception:
-            near_ratio = 0.9
+    near_ratio = settings["near_limit_ratio"]
 
     # 残りが 0 に近ければオンラインはやめておく
     return remaining > (1.0 - near_ratio)
 
 
-def generate_online_question(
-    meta: MetaManager,
-    chapter_label: str,
-) -> Optional[Question]:
+# 優先モデルが一時的な障害で使えないときに試す、モデルの最大数（優先モデルを含む）
+MODEL_FALLBACK_LIMIT = 3
+
+
+def _model_candidates(primary: str, fallback_models: Tuple[str, ...]) -> List[str]:
     """
-    指定された章ラベルからオンライン問題を 1問生成する。
-    失敗した場合は None を返し、呼び出し側でオフラインへフォールバックする。
+    優先モデルを先頭に、フォールバック用のモデルを続けた候補リストを返す。
+    フォールバックは [gemini].fallback_models の順で、利用可能なモデルだけを使う
+    （一覧の名前は "models/" 付きなので、どちらの書き方でも突き合わせる）。
+    """
+    available = set(list_gemini_models())
+    candidates = [primary]
+    for name in fallback_models:
+        if len(candidates) >= MODEL_FALLBACK_LIMIT:
+            break
+        if name not in available:
+            name = f"models/{name}"
+            if name not in available:
+                continue
+        if name not in candidates and name != f"models/{primary}":
+            candidates.append(name)
+    return candidates
+
+
+def _generate_text(
+    model: Any,
+    prompt: str,
+    settings: Dict[str, Any],
+    quota: Any,
+    now: float,
+    timeout: float,
+) -> Tuple[str, Any]:
     """
+    1 つのモデルで 1 回だけ生成を試み、(応答テキスト, 応答オブジェクト) を返す（失敗は例外）。
+    応答オブジェクトは使用トークン数（usage_metadata）を読むために返す。
+    settings は get_gemini_settings() の戻り値。timeout 秒のタイムアウト付きで呼び出すので、
+    応答が無ければ例外になる。出力トークン数にも上限を付ける。
+    now は直前のレート判定に使った時刻（time.monotonic()）で、リクエストの記録にも使う。
+    """
+    quota.record_request(now)
+    response = model.generate_content(  # type: ignore[call-arg]
+        prompt,
+        generation_config={"max_output_tokens": settings["max_output_tokens"]},
+        stream=True,
+        request_options={"timeout": timeout},
+    )
+    return collect_stream_text(response), response
+
+
+@dataclass(frozen=True)
+class _OnlineRequest:
+    """
+    オンライン生成 1 回分の入力。
+    Streamlit の API（キャッシュや設定の読み込み）を使う部分はメインスレッドで済ませ、
+    _run_online_generation() にはこの値だけを渡す（先読みスレッドからも呼べるように）。
+    """
+
+    chapter_label: str
+    chapter_group: str
+    models: Tuple[Any, ...]
+    settings: Dict[str, Any]
+    rpm_limit: int
+
+
+def _prepare_online_request(
+    meta: MetaManager,
+    chapter_label: str,
+) -> Optional[_OnlineRequest]:
+    """オンライン生成に必要なものを揃える。オンラインを使えない状態なら None。"""
     if not can_use_online(meta):
         return None
 
@@ -284,71 +583,314 @@ def generate_online_question(
     if not model_name:
         return None
 
-    chapters = meta.meta.get("chapters", {})
-    chapter_group = "ディープラーニング"
-    # シラバス情報から group label をざっくり取得
-    if isinstance(chapters, dict):
-        for _gk, gv in chapters.items():
-            sub = gv.get("subchapters", {})
-            if not isinstance(sub, dict):
-                continue
-            for _sk, sv in sub.items():
-                if sv.get("label") == chapter_label:
-                    chapter_group = gv.get("label", chapter_group)
-                    break
+    key_fingerprint = _api_key_fingerprint()
+    settings = get_gemini_settings()
+    return _OnlineRequest(
+        chapter_label=chapter_label,
+        # シラバス情報から group label を取得（見つからなければ汎用ラベル）
+        chapter_group=meta.get_chapter_group(chapter_label, "ディープラーニング"),
+        models=tuple(
+            _get_model(key_fingerprint, name)
+            for name in _model_candidates(model_name, settings["fallback_models"])
+        ),
+        settings=settings,
+        rpm_limit=int(get_quota_settings()["rpm"]),
+    )
+
 
-    prompt = build_online_prompt(chapter_label, chapter_group)
-    approx_prompt_tokens = len(prompt) // 2
+def _run_online_generation(meta: MetaManager, req: _OnlineRequest) -> Optional[Question]:
+    """
+    req に従って Gemini で 1 問生成する。失敗した場合は None。
+    Streamlit の API は呼ばないので、バックグラウンドのスレッドから実行してもよい。
+    """
+    chapter_label = req.chapter_label
+    chapter_group = req.chapter_group
+    prompt = build_prompt(chapter_label, chapter_group)
+    prompt_tokens = approx_prompt_tokens(chapter_label, chapter_group)
     quota = meta.get_quota_manager()
 
+    # 一時的な障害（5xx / UNAVAILABLE / タイムアウト）だけは、同じモデルで
+    # 少し待って再試行し、それでも駄目なら次の候補モデルへ移る。
+    # 429（クォータ切れ）やそれ以外のエラーはその場で諦めてオフラインへ。
+    # 再試行・フォールバックを含めた全体は generation_deadline 秒で打ち切り、
+    # 各リクエストのタイムアウトも残り時間までに縮める。
+    deadline = time.monotonic() + req.settings["generation_deadline"]
+    text: Optional[str] = None
+    response: Any = None
+    last_error = ""
+    gated = False
+    for model in req.models:
+        for attempt in range(TRANSIENT_RETRY_ATTEMPTS):
+            if attempt:
+                time.sleep(TRANSIENT_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            now = time.monotonic()
+            # 全体の時間切れ（直前の試行のエラーを記録してオフラインへ）
+            timeout = min(req.settings["request_timeout"], deadline - now)
+            if timeout <= 0:
+                gated = True
+                break
+            # 再試行で RPM を使い切ったり、クールダウンに入ったりしていれば
+            # 送っても 429 になるだけなので、リクエストを出さずに打ち切る
+            if quota.is_blocked(now) or quota.is_rate_limited(req.rpm_limit, now):
+                gated = True
+                break
+            try:
+                text, response = _generate_text(
+                    model, prompt, req.settings, quota, now, timeout
+                )
+            except Exception as e:
+                last_error = str(e)
+                if not is_transient_error(last_error):
+                    break
+                continue
+            break
+        if gated or text is not None or not is_transient_error(last_error):
+            break
+
+    if gated and not last_error:
+        # 1 回も送っていないので、エラーとしては記録しない
+        return None
+
     try:
-        model = genai.GenerativeModel(model_name)  # type: ignore[call-arg]
-        response = model.generate_content(prompt)  # type: ignore[call-arg]
-        text = response.text.strip() if hasattr(response, "text") else ""
-        data = json.loads(text)
+        if text is None:
+            raise RuntimeError(last_error or "Gemini から応答を得られませんでした。")
+        data = parse_response_json(text)
     except Exception as e:
         msg = str(e)
-        if "429" in msg or "Resource exhausted" in msg:
+        if is_quota_error(msg):
             quota.register_429(message=msg)
         else:
             quota.register_error(message=msg)
+        meta.schedule_save()
         return None
 
+    # 実際の使用トークン数で加算する（取れなければ文字数からの概算）
     approx_output_tokens = len(text) // 2
-    quota.add_usage(approx_prompt_tokens + approx_output_tokens)
-
-    # Question にマッピング
-    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-
-    jq: Dict[str, Any] = {
-        "id": f"Q_ONLINE_{created_at}",
-        "source": "online_runtime",
-        "created_at": created_at,
-        "domain": "技術分野",
-        "chapter_group": chapter_group,
-        "chapter_id": chapter_label,
-        "difficulty": data.get("difficulty", "standard"),
-        "question": data.get("question", "").strip(),
-        "choices": data.get("choices", []),
-        "correct_index": int(data.get("correct_index", 0)),
-        "explanation": data.get("explanation", "").strip(),
-        "syllabus": "G2024_v1.3",
-    }
+    quota.add_usage(usage_tokens(response, prompt_tokens + approx_output_tokens))
+    quota.register_success()
+    meta.schedule_save()
+
+    # Question にマッピング（strftime を通さず、1 回取得した now から created_at を組み立てる）
+    now_utc = datetime.now(timezone.utc)
+    created_at = (
+        f"{now_utc.year:04d}-{now_utc.month:02d}-{now_utc.day:02d}"
+        f"T{now_utc.hour:02d}:{now_utc.minute:02d}:{now_utc.second:02d}Z"
+    )
+
+    return build_question(
+        data,
+        qid=f"Q_ONLINE_{created_at}",
+        source="online_runtime",
+        created_at=created_at,
+        domain="技術分野",
+        chapter_group=chapter_group,
+        chapter_id=chapter_label,
+    )
+
 
+def generate_online_question(
+    meta: MetaManager,
+    chapter_label: str,
+) -> Optional[Question]:
+    """
+    指定された章ラベルからオンライン問題を 1問生成する。
+    失敗した場合は None を返し、呼び出し側でオフラインへフォールバックする。
+    """
+    req = _prepare_online_request(meta, chapter_label)
+    if req is None:
+        return None
+    with st.spinner("Gemini で問題を生成中…"):
+        return _run_online_generation(meta, req)
+
+
+# ----------------------------------------------------------------------
+#  次の問題の先読み
+# ----------------------------------------------------------------------
+# st.session_state に _Prefetch を置くキー
+_PREFETCH_KEY = "gq_prefetch"
+# 復習ページから出題した問題の id を置くキー（この問題への解答では先読みしない）
+_REVIEW_QID_KEY = "gq_review_qid"
+# 先読みした問題を使ってよい時間（秒）。これより古いものは捨てて作り直す
+PREFETCH_MAX_AGE_SECONDS = 300.0
+# 先読みがまだ実行中のときに待つ最大時間（秒）。超えたらオフライン問題にする
+PREFETCH_WAIT_SECONDS = 20.0
+
+
+@dataclass(frozen=True)
+class _Prefetch:
+    """
+    先読み 1 件分。
+    action / mode は先読みした時点の「次の操作」と出題モードで、
+    load_new_question() 側の操作・モードと一致したときだけ結果を使う。
+    """
+
+    action: str
+    mode: str
+    chapter_id: str
+    future: Future[Optional[Question]]
+    created_at: float
+
+
+@st.cache_resource(show_spinner=False)
+def _prefetch_executor() -> ThreadPoolExecutor:
+    """
+    先読み生成を実行するスレッドプール（プロセス全体で 1 つ）。
+    他のセッションの先読みが詰まっていても待ち続けないよう、
+    受け取る側（_take_prefetched）は待ち時間を PREFETCH_WAIT_SECONDS で打ち切る。
+    """
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="gq-prefetch")
+
+
+def _discard_prefetch() -> None:
+    """先読みを捨てる（まだ始まっていなければ取り消す）。"""
+    prefetched = st.session_state.pop(_PREFETCH_KEY, None)
+    if isinstance(prefetched, _Prefetch):
+        prefetched.future.cancel()
+
+
+def _pop_prefetch(action: str, mode: str) -> Optional[_Prefetch]:
+    """
+    action / mode に合う、期限内の先読みを取り出す。
+    合わないもの・古いものは取り消して捨て、None を返す。
+    """
+    prefetched = st.session_state.pop(_PREFETCH_KEY, None)
+    if not isinstance(prefetched, _Prefetch):
+        return None
+    age = time.monotonic() - prefetched.created_at
     if (
-        not jq["question"]
-        or not isinstance(jq["choices"], list)
-        or len(jq["choices"]) != 4
+        prefetched.action != action
+        or prefetched.mode != mode
+        or age > PREFETCH_MAX_AGE_SECONDS
     ):
+        prefetched.future.cancel()
         return None
+    return prefetched
+
+
+def _has_prefetch_headroom(meta: MetaManager) -> bool:
+    """
+    先読みにリクエストを使ってよいか。
+    先読みは使われないこともあるので、RPM に 1 回分の空きを残し、
+    日次クォータも near_limit_ratio より手前（残り 2 倍の余裕）でしか使わない。
+    """
+    settings = get_quota_settings()
+    quota = meta.get_quota_manager()
+    rpm = int(settings["rpm"])
+    if rpm > 0 and quota.is_rate_limited(max(rpm - 1, 1)):
+        return False
+    remaining = quota.get_remaining_ratio()
+    if remaining is None:
+        return True
+    return remaining > 2.0 * (1.0 - settings["near_limit_ratio"])
+
 
-    return Question.from_dict(jq)
+def prefetch_next_question(session: SessionState, meta: MetaManager) -> None:
+    """
+    解答直後、利用者が解説を読んでいる間に次のオンライン問題を裏で生成しておく。
+
+    先読みは「次の問題」用で、次に出題する章はこの時点で choose_next_chapter により決める。
+    load_new_question() は同じ操作・同じモードで、PREFETCH_MAX_AGE_SECONDS 以内のときだけ
+    その章と生成結果を使う。先読みは 1 セッションにつき 1 問だけで、オンラインを使えないとき、
+    クォータに余裕が無いとき、復習ページから出題した問題に解答したときは何もしない。
+    """
+    if session.mode == "offline" or _PREFETCH_KEY in st.session_state:
+        return
+    current = session.current_question
+    if current is not None and st.session_state.get(_REVIEW_QID_KEY) == current.id:
+        return
+    if not _has_prefetch_headroom(meta):
+        return
+
+    available_chapters = available_chapter_ids(meta)
+    if not available_chapters:
+        return
+    chapter_id = meta.choose_next_chapter(available_chapter_ids=available_chapters)
+    if chapter_id is None:
+        return
+
+    req = _prepare_online_request(meta, chapter_id)
+    if req is None:
+        return
+    future = _prefetch_executor().submit(_run_online_generation, meta, req)
+    st.session_state[_PREFETCH_KEY] = _Prefetch(
+        action="next",
+        mode=session.mode,
+        chapter_id=chapter_id,
+        future=future,
+        created_at=time.monotonic(),
+    )
+
+
+def _take_prefetched(future: Future[Optional[Question]]) -> Optional[Question]:
+    """
+    先読みの結果を受け取る。失敗していれば None。
+    まだ実行中なら PREFETCH_WAIT_SECONDS まで待ち、間に合わなければ None（オフラインへ）。
+    他のセッションの先読みが詰まっていてまだ始まっていないなら、取り消して None を返す
+    （呼び出し側は future.cancelled() を見てその場で生成し直す）。
+    """
+    try:
+        if future.done():
+            return future.result()
+        if future.cancel():
+            return None
+        with st.spinner("Gemini で問題を生成中…"):
+            return future.result(timeout=PREFETCH_WAIT_SECONDS)
+    except Exception:
+        return None
+
+
+# ----------------------------------------------------------------------
+#  問題バンクのキャッシュ
+# ----------------------------------------------------------------------
+@st.cache_resource(ttl=24 * 60 * 60, show_spinner=False)
+def _cached_all_questions(mtime_ns: int) -> Tuple[Question, ...]:
+    """
+    全問題をタプルで返す。
+    Streamlit は操作のたびにスクリプト全体を再実行するため、
+    question_bank.jsonl の更新時刻（mtime_ns）ごとに 1 回だけ構築してキャッシュする。
+
+    cache_data だと取得のたびに全問題を pickle から復元するので、
+    読み取り専用として同じオブジェクトを共有する cache_resource を使う。
+    """
+    return tuple(get_all_questions())
+
+
+@st.cache_resource(ttl=24 * 60 * 60, show_spinner=False)
+def _cached_available_chapters(mtime_ns: int) -> Tuple[str, ...]:
+    """問題バンクに存在する chapter_id をソート済みタプルで返す（更新時刻ごとにキャッシュ）。"""
+    return tuple(sorted({q.chapter_id for q in _cached_all_questions(mtime_ns)}))
+
+
+def available_chapter_ids(meta: MetaManager) -> Tuple[str, ...]:
+    """
+    出題候補の章 ID 一覧を返す（問題バンクに問題がある章だけ）。
+
+    meta.json のシラバス構造（chapters）が定義されていれば、その並び順のまま
+    問題バンクの章と突き合わせる。問題の無い章を候補に入れると、出題回数が
+    増えないまま選ばれ続け、オフラインでは無作為な問題に流れてしまうため。
+    問題バンクが空なら空のタプルを返す。
+    """
+    bank_chapters = _cached_available_chapters(bank_mtime_ns())
+    if not bank_chapters:
+        return ()
+
+    labels = meta.get_all_chapter_labels()
+    if labels:
+        in_bank = set(bank_chapters)
+        selected = tuple(label for label in labels if label in in_bank)
+        if selected:
+            return selected
+    return bank_chapters
 
 
 # ----------------------------------------------------------------------
 #  新しい問題のロード（オンライン/オフライン混在を統合）
 # ----------------------------------------------------------------------
-def load_new_question(session: SessionState, meta: MetaManager) -> None:
+def load_new_question(
+    session: SessionState,
+    meta: MetaManager,
+    change_chapter: bool = False,
+) -> None:
     """
     SessionState に新しい問題をセットする。
     - mode = "online" の場合はオンライン優先（失敗したらオフライン）
@@ -356,21 +898,43 @@ def load_new_question(session: SessionState, meta: MetaManager) -> None:
     - mode = "auto" の場合はオンライン試行→失敗時オフライン
     いずれの場合も、MetaManager の choose_next_chapter により
     偏りを抑えた章選択を行う。
+    change_chapter=True（「章を変える」）のときは先読みを捨て、
+    今の問題とは別の章から選び直す。
     """
-    all_questions = get_all_questions()
-    available_chapters = sorted({q.chapter_id for q in all_questions})
+    available_chapters = available_chapter_ids(meta)
     if not available_chapters:
         st.error("問題バンクが空です。bank/question_bank.jsonl を確認してください。")
         return
 
-    chapter_id = meta.choose_next_chapter(available_chapter_ids=available_chapters)
-    if chapter_id is None:
-        # フォールバックとして先頭の章を使用
-        chapter_id = list(available_chapters)[0]
-
     mode = session.mode
 
+    # 先読みは「次の問題」・同じモードで、期限内のものだけ使う
+    prefetched: Optional[_Prefetch] = None
+    if change_chapter or mode == "offline":
+        _discard_prefetch()
+    else:
+        prefetched = _pop_prefetch("next", mode)
+
+    if prefetched is not None:
+        chapter_id = prefetched.chapter_id
+    else:
+        candidates = available_chapters
+        current = session.current_question
+        if change_chapter and current is not None:
+            others = tuple(c for c in available_chapters if c != current.chapter_id)
+            if others:
+                candidates = others
+        chapter_id = meta.choose_next_chapter(available_chapter_ids=candidates)
+        if chapter_id is None:
+            # フォールバックとして先頭の章を使用
+            chapter_id = candidates[0]
+
     def try_online() -> Optional[Question]:
+        if prefetched is not None:
+            q = _take_prefetched(prefetched.future)
+            # 順番待ちのまま取り消した先読みは、ここで生成し直す
+            if q is not None or not prefetched.future.cancelled():
+                return q
         return generate_online_question(meta, chapter_label=chapter_id)
 
     def try_offline() -> Optional[Question]:
@@ -428,87 +992,100 @@ def render_home_page() -> None:
     col1, col2 = st.columns(2)
     with col1:
         if st.button("🚀 クイズを始める", use_container_width=True):
-            set_page("quiz")
-            rerun()
+            goto_page("quiz")
     with col2:
         if st.button("🔁 間違えた問題だけで復習", use_container_width=True):
-            set_page("review")
-            rerun()
+            goto_page("review")
 
     st.write("")
     col3, col4 = st.columns(2)
     with col3:
         if st.button("📊 学習統計を見る", use_container_width=True):
-            set_page("stats")
-            rerun()
+            goto_page("stats")
     with col4:
         if st.button("⚙️ 設定", use_container_width=True):
-            set_page("settings")
-            rerun()
+            goto_page("settings")
 
     st.write("")
     if st.button("❓ 使い方", use_container_width=True):
-        set_page("help")
-        rerun()
+        goto_page("help")
 
 
 # ----------------------------------------------------------------------
 #  ページ: クイズ
 # ----------------------------------------------------------------------
-def render_quiz_main_page() -> None:
-    session = get_session_state()
-    meta = get_meta_manager()
-
-    if not isinstance(session.current_question, Question):
-        load_new_question(session, meta)
+@_fragment
+def _quiz_fragment(session: SessionState, meta: MetaManager) -> None:
+    """
+    問題表示〜解答〜次の問題まで。
 
+    フラグメントとして実行されるため、選択肢や「次の問題」のクリックでは
+    この関数だけが再実行され、設定読み込みなどのページ全体の処理は走らない。
+    ボタンの処理は on_click コールバックで再実行の前に済ませるので、
+    クリック 1 回につき再実行も 1 回で済む（st.rerun で描画し直さない）。
+    """
     quota_status = meta.get_quota_status()
     progress_ratio = None  # 現状は未実装
 
     mode_label = session.mode.upper()
 
-    ui_result = render_quiz_page(
-        session=session,
-        progress_ratio=progress_ratio,
-        quota_status=quota_status,
-        mode_label=mode_label,
-    )
-
-    if ui_result["selected_choice"] is not None:
-        idx = ui_result["selected_choice"]
-        correct = session.answer(idx)
+    def on_choice(idx: int) -> None:
+        session.answer(idx)
         if session.current_question is not None:
             meta.record_usage(
                 chapter_id=session.current_question.chapter_id,
                 source=session.source,
             )
-            meta.save()
-        if correct:
-            st.success("正解です！")
-        else:
-            st.warning("不正解です。解説を確認しましょう。")
+            meta.schedule_save()
+        # 解説を読んでいる間に次の問題を用意しておく
+        prefetch_next_question(session, meta)
 
-    if ui_result["clicked_next"]:
+    def on_next() -> None:
         load_new_question(session, meta)
-        rerun()
-    elif ui_result["clicked_prev"]:
-        if session.history:
-            last = session.history[-1]
-            prev_q = get_question_by_id(last.question_id)
-            if prev_q is not None:
-                session.start_new_question(
-                    question=prev_q,
-                    source=last.source,
-                    model_name=session.model_name,
-                )
-                rerun()
-    elif ui_result["clicked_change_chapter"]:
+
+    def on_change_chapter() -> None:
+        load_new_question(session, meta, change_chapter=True)
+
+    def on_prev() -> None:
+        if not session.history:
+            return
+        last = session.history[-1]
+        prev_q = get_question_by_id(last.question_id)
+        if prev_q is not None:
+            session.start_new_question(
+                question=prev_q,
+                source=last.source,
+                model_name=session.model_name,
+            )
+
+    render_quiz_page(
+        session=session,
+        progress_ratio=progress_ratio,
+        quota_status=quota_status,
+        mode_label=mode_label,
+        on_choice=on_choice,
+        on_next=on_next,
+        on_prev=on_prev,
+        on_change_chapter=on_change_chapter,
+    )
+
+    if session.is_correct is True:
+        st.success("正解です！")
+    elif session.is_correct is False:
+        st.warning("不正解です。解説を確認しましょう。")
+
+
+def render_quiz_main_page() -> None:
+    session = get_session_state()
+    meta = get_meta_manager()
+
+    if not isinstance(session.current_question, Question):
         load_new_question(session, meta)
-        rerun()
+
+    _quiz_fragment(session, meta)
 
     if st.button("🏠 ホームに戻る", use_container_width=True):
-        set_page("home")
-        rerun()
+        goto_page("home")
 
 
 # ----------------------------------------------------------------------
@@ -520,14 +1097,17 @@ def render_review_page() -> None:
 
     st.markdown("## 🔁 間違えた問題だけで復習")
 
-    wrongs = [r for r in session.history if not r.correct]
-    if not wrongs:
+    # 不正解の位置は SessionState.answer() が記録しているので、履歴全体は走査しない
+    wrong_indices = session.wrong_indices
+    if not wrong_indices:
         st.info("まだ間違えた問題の記録がありません。クイズを解いてから利用してください。")
     else:
-        st.write(f"これまでに **{len(wrongs)} 問** 間違えています。")
+        st.write(f"これまでに **{len(wrong_indices)} 問** 間違えています。")
+        # id -> Question の辞書（プロセス内キャッシュ）をループの外で 1 回だけ取得
+        questions_by_id = load_question_bank()
         rows = []
-        for r in reversed(wrongs[-10:]):
-            q = get_question_by_id(r.question_id)
+        for i in itertools.islice(reversed(wrong_indices), 10):
+            q = questions_by_id.get(session.history[i].question_id)
             if q is None:
                 continue
             rows.append(f"- [{q.chapter_id}] {q.question[:40]}...")
@@ -538,28 +1118,64 @@ def render_review_page() -> None:
         if st.button("ランダムに 1 問復習する", use_container_width=True):
             import random
 
-            r = random.choice(wrongs)
-            q = get_question_by_id(r.question_id)
+            r = session.history[random.choice(wrong_indices)]
+            q = questions_by_id.get(r.question_id)
             if q is not None:
                 session.start_new_question(
                     question=q,
                     source="offline",
                     model_name=None,
                 )
-                set_page("quiz")
-                rerun()
+                # 復習の問題に解答しても、次の問題は先読みしない
+                _discard_prefetch()
+                st.session_state[_REVIEW_QID_KEY] = q.id
+                goto_page("quiz")
 
     if st.button("🏠 ホームに戻る", use_container_width=True):
-        set_page("home")
-        rerun()
+        goto_page("home")
 
 
 # ----------------------------------------------------------------------
 #  ページ: 学習統計
 # ----------------------------------------------------------------------
-def render_stats_page() -> None:
+@st.cache_data(show_spinner=False)
+def _chapter_stats_frame(revision: int, _chapter_stats: Dict[str, Any]) -> Any:
+    """
+    章ごとの出題回数を DataFrame にする。
+
+    revision（MetaManager の更新回数）だけをキャッシュキーにし、
+    統計が変わらない限り再構築しない。行数 0 なら None を返す。
+    """
+    # pandas / numpy は統計を表示するときだけ必要なので、ここで初めて読み込む
+    import numpy as np
     import pandas as pd
 
+    chaps: List[str] = []
+    totals: List[int] = []
+    onlines: List[int] = []
+    offlines: List[int] = []
+    for chap, stat in _chapter_stats.items():
+        if not isinstance(stat, dict):
+            continue
+        chaps.append(chap)
+        totals.append(stat.get("total_questions", 0))
+        onlines.append(stat.get("online_questions", 0))
+        offlines.append(stat.get("offline_questions", 0))
+
+    if not chaps:
+        return None
+
+    return pd.DataFrame(
+        {
+            "章": pd.Categorical(chaps),
+            "合計": np.asarray(totals, dtype=np.int32),
+            "オンライン": np.asarray(onlines, dtype=np.int32),
+            "オフライン": np.asarray(offlines, dtype=np.int32),
+        }
+    ).sort_values("合計", ascending=False, kind="stable")
+
+
+def render_stats_page() -> None:
     meta = get_meta_manager()
     st.markdown("## 📊 学習統計")
 
@@ -579,78 +1195,82 @@ def render_stats_page() -> None:
     if not isinstance(chapter_stats, dict) or not chapter_stats:
         st.info("まだ章ごとの出題統計はありません。")
     else:
-        rows = []
-        for chap, stat in chapter_stats.items():
-            if not isinstance(stat, dict):
-                continue
-            rows.append(
-                {
-                    "章": chap,
-                    "合計": stat.get("total_questions", 0),
-                    "オンライン": stat.get("online_questions", 0),
-                    "オフライン": stat.get("offline_questions", 0),
-                }
-            )
-        if rows:
-            df = pd.DataFrame(rows).sort_values("合計", ascending=False)
+        # 他セッションの更新と競合しないよう、浅いコピーを渡す
+        df = _chapter_stats_frame(meta.revision, dict(chapter_stats))
+        if df is not None:
             st.dataframe(df, use_container_width=True)
 
     if st.button("🏠 ホームに戻る", use_container_width=True):
-        set_page("home")
-        rerun()
+        goto_page("home")
 
 
 # ----------------------------------------------------------------------
 #  ページ: 設定
 # ----------------------------------------------------------------------
+# 出題モードと表示ラベルの対応（設定画面のラジオボタン用）
+_MODE_MAP: Dict[str, str] = {
+    "auto": "自動 (オンライン優先+フォールバック)",
+    "online": "オンライン優先",
+    "offline": "オフラインのみ",
+}
+_MODES = tuple(_MODE_MAP)
+_MODE_LABELS = tuple(_MODE_MAP.values())
+_MODE_INDEX = {m: i for i, m in enumerate(_MODES)}
+_LABEL_TO_MODE = {label: m for m, label in _MODE_MAP.items()}
+
+
 def render_settings_page() -> None:
     st.markdown("## ⚙️ 設定")
 
     session = get_session_state()
     cfg = load_app_config()
 
-    st.markdown("### 出題モード")
+    online_ready = _has("google.generativeai") and bool(os.getenv("GEMINI_API_KEY"))
+    selected_model: Optional[str] = None
 
-    mode_map = {
-        "auto": "自動 (オンライン優先+フォールバック)",
-        "online": "オンライン優先",
-        "offline": "オフラインのみ",
-    }
-    modes = list(mode_map.keys())
-    labels = [mode_map[m] for m in modes]
+    # ラジオやセレクトボックスを操作するたびにスクリプト全体を再実行しないよう、
+    # フォームにまとめて「保存」時にだけ反映する
+    with st.form("settings_form"):
+        st.markdown("### 出題モード")
 
-    try:
-        index = modes.index(session.mode)
-    except ValueError:
-        index = 0
-
-    selected_label = st.radio(
-        "出題モード",
-        labels,
-        index=index,
-    )
-    selected_mode = modes[labels.index(selected_label)]
-    session.mode = selected_mode
+        index = _MODE_INDEX.get(session.mode, 0)
 
-    st.write("---")
-    st.markdown("### オンラインモデル")
+        selected_label = st.radio(
+            "出題モード",
+            _MODE_LABELS,
+            index=index,
+        )
 
-    if not HAS_GEMINI or not os.getenv("GEMINI_API_KEY"):
-        st.info("オンライン出題を利用するには GEMINI_API_KEY を環境変数に設定してください。")
-    else:
-        init_gemini_if_needed()
-        models = list_gemini_models()
-        if not models:
-            st.warning("利用可能な Gemini モデルが取得できませんでした。")
+        st.write("---")
+        st.markdown("### オンラインモデル")
+
+        if not online_ready:
+            st.info("オンライン出題を利用するには GEMINI_API_KEY を環境変数に設定してください。")
         else:
-            preferred = get_preferred_model_name()
-            try:
+            models = list_gemini_models()
+            if not models:
+                st.warning("利用可能な Gemini モデルが取得できませんでした。")
+            else:
+                preferred = get_preferred_model_name()
                 idx = models.index(preferred) if preferred in models else 0
-            except ValueError:
-                idx = 0
-            selected = st.selectbox("優先的に使うモデル", models, index=idx)
-            st.session_state["preferred_model"] = selected
-            st.write(f"現在の優先モデル: `{selected}`")
+                selected_model = st.selectbox("優先的に使うモデル", models, index=idx)
+
+        submitted = st.form_submit_button("💾 設定を保存", use_container_width=True)
+
+    if submitted:
+        session.mode = _LABEL_TO_MODE[selected_label]
+        if selected_model is not None:
+            st.session_state["preferred_model"] = selected_model
+        st.success("設定を保存しました。")
+
+    if online_ready:
+        current = get_preferred_model_name()
+        if current:
+            st.write(f"現在の優先モデル: `{current}`")
+
+        if st.button("🔄 モデル一覧を再取得", use_container_width=True):
+            _clear_models_cache()
+            rerun()
 
     st.write("---")
     st.markdown("### アプリ情報")
@@ -658,8 +1278,7 @@ def render_settings_page() -> None:
     st.write(f"- 言語: **{cfg.get('app', {}).get('language', 'ja')}**")
 
     if st.button("🏠 ホームに戻る", use_container_width=True):
-        set_page("home")
-        rerun()
+        goto_page("home")
 
 
 # ----------------------------------------------------------------------
@@ -690,8 +1309,7 @@ def render_help_page() -> None:
     )
 
     if st.button("🏠 ホームに戻る", use_container_width=True):
-        set_page("home")
-        rerun()
+        goto_page("home")
 
 
 # ----------------------------------------------------------------------
@@ -13,6 +13,7 @@ Streamlit 製 G検定クイズアプリの内部モジュールをまとめる
 
 # パッケージとして公開しているサブモジュール名
 __all__ = [
+    "generation",
     "meta",
     "models",
     "question_bank",
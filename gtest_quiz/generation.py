@@ -0,0 +1,257 @@
+"""
+generation.py
+======================
+
+Gemini による四択問題生成のうち、Streamlit に依存しない共通部分をまとめるモジュール。
+
+app.py（オンライン出題）と tools/auto_refill.py（問題バンクの自動補充）の
+両方から使う:
+- プロンプトの組み立て（固定部分は import 時に 1 回だけ作る）
+- 応答の形（JSON スキーマ）を指定する generation_config
+- ストリーミング応答の連結（サイズ上限付き）と、使用トークン数の取得
+- 応答 JSON の解釈（orjson があれば使う / コードフェンスを許容）
+- 応答 dict から Question への変換と検証
+- 429（Resource exhausted）の判定
+
+モデルの選択やクォータ管理、保存先はそれぞれの呼び出し側が持つ。
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from .models import Question
+
+# JSON パースは orjson があればそちらを使う（C 実装で標準 json より高速）
+try:
+    import orjson  # type: ignore[import]
+
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson は任意依存
+    _json_loads = json.loads
+
+
+# 生成した問題に付けるシラバス版
+SYLLABUS_VERSION = "G2024_v1.3"
+
+# generate_content の既定タイムアウト（秒）。応答が返らないまま固まらないようにする。
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60.0
+
+# 1 回の生成で出力させる最大トークン数の既定値。
+# 1 問分（問題文・選択肢 4 つ・解説）は数百トークンに収まるので、
+# 暴走した長い応答で待たされないよう上限を付ける。
+DEFAULT_MAX_OUTPUT_TOKENS = 1024
+
+# 一時的な障害のとき、同じモデルで試す回数と、再試行までの待ち時間の基準（秒）。
+# 待ち時間は BASE * 2**attempt（0.5 秒, 1 秒, ...）
+TRANSIENT_RETRY_ATTEMPTS = 2
+TRANSIENT_RETRY_BASE_SECONDS = 0.5
+
+# 再試行・フォールバックを含めた 1 問の生成にかける時間の上限（秒）の既定値。
+# タイムアウトも再試行の対象なので、上限が無いと request_timeout × 試行回数だけ待たされる。
+DEFAULT_GENERATION_DEADLINE_SECONDS = 90.0
+
+# 優先モデルが一時的な障害で使えないときに、この順で試すモデルの既定値。
+# response_schema（JSON 出力）に対応したテキスト生成モデルだけを並べる。
+DEFAULT_FALLBACK_MODELS: Tuple[str, ...] = (
+    "gemini-2.5-flash",
+    "gemini-2.0-flash",
+    "gemini-2.0-flash-lite",
+)
+
+# ストリーミング応答として受け付ける最大文字数。
+# 1 問分の JSON は数 KB なので、これを超えるのは暴走した応答とみなして打ち切る。
+MAX_RESPONSE_CHARS = 10 * 1024 * 1024
+
+
+# ----------------------------------------------------------------------
+#  プロンプト
+# ----------------------------------------------------------------------
+# 可変なのは分野・中項目の 2 か所だけなので、前後の文字列は import 時に 1 回だけ作る。
+# 出力の形は GENERATION_CONFIG の response_schema で強制するため、
+# JSON の記入例は載せず、各キーの中身だけを説明する（入力トークンを減らす）。
+# 可変部分はすべて末尾に置き、それより前（指示・出力条件）は毎回バイト単位で同じにする。
+# 先頭が一致するリクエストは Gemini の暗黙的キャッシュの対象になりやすい。
+_PROMPT_PREFIX = """
+あなたは日本語で G検定(JDLA Deep Learning for GENERAL) の高品質な四択問題を作る専門家です。
+
+以下の制約を厳密に守って、末尾のシラバス情報で指定された項目に対応する四択問題を 1 問だけ生成してください。
+
+# 出力条件
+- G検定本試験レベルの知識を問う。
+- 純粋な知識問題・概念理解問題・応用イメージ問題をバランス良く含める。
+- 選択肢は必ず 4 つ。紛らわしいが、1つだけ明確に正しい選択肢を含める。
+
+# 各キーの内容
+- question: 問題文
+- choices: 選択肢 4 つ
+- correct_index: 正解の選択肢の位置（0〜3）
+- explanation: 正解の理由と、他の選択肢が誤りである理由
+- difficulty: basic / standard / advanced のいずれか
+
+JSON オブジェクト 1 つだけを出力してください。
+
+# シラバス情報
+- 分野: """
+_PROMPT_MID = """
+- 中項目: """
+_PROMPT_SUFFIX = "\n"
+_PROMPT_STATIC_LEN = len(_PROMPT_PREFIX) + len(_PROMPT_MID) + len(_PROMPT_SUFFIX)
+
+
+def build_prompt(chapter_label: str, chapter_group: str) -> str:
+    """指定したシラバス中項目の四択問題を 1 問生成させるプロンプト。"""
+    return _PROMPT_PREFIX + chapter_group + _PROMPT_MID + chapter_label + _PROMPT_SUFFIX
+
+
+def approx_prompt_tokens(chapter_label: str, chapter_group: str) -> int:
+    """
+    build_prompt() の概算トークン数（文字数 / 2）。
+    プロンプト文字列を組み立て直さずに、固定部分の長さから計算する。
+    """
+    return (_PROMPT_STATIC_LEN + len(chapter_group) + len(chapter_label)) // 2
+
+
+# ----------------------------------------------------------------------
+#  応答スキーマ
+# ----------------------------------------------------------------------
+class QuizResponse(TypedDict):
+    """Gemini に返させる 1 問分の JSON の形（build_question() が読むキー）。"""
+
+    question: str
+    choices: List[str]
+    correct_index: int
+    explanation: str
+    difficulty: str
+
+
+# GenerativeModel に渡す generation_config。
+# response_schema を指定すると、モデル側のデコードで JSON の形が強制されるため、
+# 前置きの文章やコードフェンス付きの応答で 1 回分の生成を無駄にしにくくなる。
+# （parse_response_json / build_question の検証はそのまま残す）
+GENERATION_CONFIG: Dict[str, Any] = {
+    "response_mime_type": "application/json",
+    "response_schema": QuizResponse,
+}
+
+
+# ----------------------------------------------------------------------
+#  応答の読み取り
+# ----------------------------------------------------------------------
+def collect_stream_text(response: Any) -> str:
+    """
+    generate_content(..., stream=True) のチャンクを順に連結して返す。
+    MAX_RESPONSE_CHARS を超えたら ValueError を投げる。
+    """
+    parts: List[str] = []
+    size = 0
+    for chunk in response:
+        piece = getattr(chunk, "text", "") or ""
+        size += len(piece)
+        if size > MAX_RESPONSE_CHARS:
+            raise ValueError("Gemini の応答が大きすぎるため打ち切りました。")
+        parts.append(piece)
+    return "".join(parts).strip()
+
+
+def usage_tokens(response: Any, fallback: int) -> int:
+    """
+    応答の usage_metadata から、実際に使われたトークン数（入力 + 出力）を返す。
+    ストリーミングの場合はすべてのチャンクを読み終えてから呼ぶこと。
+    取得できなければ fallback（文字数からの概算）を返す。
+    """
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", 0) if usage is not None else 0
+    return total if isinstance(total, int) and total > 0 else fallback
+
+
+# 応答が ```json ... ``` のコードフェンスで囲まれている場合に中身だけを取り出す
+_CODE_FENCE_RE = re.compile(r"^```[A-Za-z0-9_-]*\s*\n?(.*?)\n?```\s*$", re.DOTALL)
+
+
+def parse_response_json(text: str) -> Any:
+    """
+    Gemini の応答テキストを JSON として解釈する。
+    そのままでは読めない場合だけ、コードフェンスを外してもう一度試す
+    （JSON 以外を出力しないよう指示していても、フェンス付きで返ることがある）。
+    """
+    try:
+        return _json_loads(text)
+    except ValueError:
+        m = _CODE_FENCE_RE.match(text.strip())
+        if m is None:
+            raise
+        return _json_loads(m.group(1))
+
+
+def is_quota_error(message: str) -> bool:
+    """例外メッセージが 429（Resource exhausted）を示していれば True。"""
+    return "429" in message or "Resource exhausted" in message
+
+
+# 一時的な障害（5xx / UNAVAILABLE / タイムアウト）を示す例外メッセージ
+_TRANSIENT_ERROR_RE = re.compile(
+    r"\b(5\d\d|UNAVAILABLE|DeadlineExceeded|Deadline Exceeded|timed out)\b"
+)
+
+
+def is_transient_error(message: str) -> bool:
+    """
+    例外メッセージが一時的な障害を示していれば True（再試行や別モデルで成功しうる）。
+    429 はクォータ切れなので含めない。
+    """
+    return not is_quota_error(message) and _TRANSIENT_ERROR_RE.search(message) is not None
+
+
+# ----------------------------------------------------------------------
+#  Question への変換
+# ----------------------------------------------------------------------
+def build_question(
+    data: Dict[str, Any],
+    *,
+    qid: str,
+    source: str,
+    created_at: str,
+    domain: str,
+    chapter_group: str,
+    chapter_id: str,
+) -> Optional[Question]:
+    """
+    応答 JSON（dict）を Question に変換する。
+    出題できない形（Question.is_valid() が False）なら None。
+    """
+    if not isinstance(data, dict):
+        return None
+    choices = data.get("choices", [])
+    if not isinstance(choices, list):
+        return None
+    # モデルの応答や既存のバンク行は型が崩れていることがあるので、
+    # 例外にせず None（オフラインへのフォールバック / スキップ）にする
+    question = data.get("question", "")
+    explanation = data.get("explanation", "")
+    if not isinstance(question, str) or not isinstance(explanation, str):
+        return None
+    try:
+        correct_index = int(data.get("correct_index", 0))
+    except (TypeError, ValueError):
+        return None
+
+    jq: Dict[str, Any] = {
+        "id": qid,
+        "source": source,
+        "created_at": created_at,
+        "domain": domain,
+        "chapter_group": chapter_group,
+        "chapter_id": chapter_id,
+        "difficulty": data.get("difficulty", "standard"),
+        "question": question.strip(),
+        "choices": choices,
+        "correct_index": correct_index,
+        "explanation": explanation.strip(),
+        "syllabus": SYLLABUS_VERSION,
+    }
+
+    q = Question.from_dict(jq)
+    return q if q.is_valid() else None
@@ -31,24 +31,43 @@ meta.json の想定構造（抜粋）:
       ...
   },
   "last_chapter_id": "1. 人工知能の定義",
+  "log_seq": 0,        # meta.json に取り込み済みの追記ログの通し番号
   "chapters": { ... }  # シラバス構造（大分類・中分類）
 }
 
 ※ 実際の meta.json は bank/meta.json に存在するものを真とする。
+
+解答ごとの usage 更新は meta.json 全体を書き直さず、
+追記専用ログ（bank/meta.log.jsonl）に 1 行ずつ追記する:
+
+{"seq": 1, "chap": "1. 人工知能の定義", "src": "offline", "ts": 1735689600}
+
+load() ではスナップショット（meta.json）を読んだ後に、
+log_seq より新しいログを再生する。save() はログを meta.json に
+取り込んで（コンパクション）ログを削除する。
 """
 
 from __future__ import annotations
 
+import atexit
 import json
+import os
 import random
+import threading
+import time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Literal
+from typing import Any, Dict, List, Optional, Literal, Sequence
 
 from .quota import QuotaManager
 
 UsageSource = Literal["online", "offline"]
 
+# 追記ログをこの件数ためたら meta.json に取り込む
+COMPACT_EVERY_EVENTS = 100
+# schedule_save() の既定の遅延（秒）。この間隔でログを meta.json に取り込む
+COMPACT_INTERVAL_SECONDS = 60.0
+
 
 class MetaManager:
     """
@@ -64,8 +83,26 @@ class MetaManager:
 
     def __init__(self, path: str = "bank/meta.json"):
         self.path = Path(path)
+        # bank/meta.json -> bank/meta.log.jsonl
+        self.log_path = self.path.with_name(self.path.stem + ".log.jsonl")
         self.meta: Dict[str, Any] = {}
         self.quota: Optional[QuotaManager] = None
+        # meta の内容が変わるたびに増える番号（UI 側のキャッシュキー用）
+        self.revision = 0
+        # subchapter の label 一覧と、label -> 大分類 label の索引（load() で構築）
+        self._chapter_labels: List[str] = []
+        self._label_to_group: Dict[str, str] = {}
+        # Streamlit では複数セッションが同じインスタンスを共有するため、
+        # 書き込みはこのロックで直列化する。
+        self._lock = threading.Lock()
+        # 未保存の変更があるか / 予約済みの保存タイマー
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        # 追記ログのファイルハンドル（初回追記時に開く）と、未コンパクションの件数
+        self._log_file: Optional[Any] = None
+        self._log_events = 0
+        # 予約中の保存がタイマー発火前にプロセス終了で失われないよう、終了時にも書き出す
+        atexit.register(self._flush_if_dirty)
 
     # ------------------------------------------------------------------
     # ロード / セーブ
@@ -99,18 +136,78 @@ class MetaManager:
 
         # 足りないキーを安全に補完
         self._ensure_structure()
-        # QuotaManager を初期化
-        self.quota = QuotaManager(self.meta)
+        # スナップショット以降の追記ログを再生
+        self._replay_log()
+        # 章ラベルの索引を作り直す
+        self._build_chapter_index()
+        self.revision += 1
+        # QuotaManager を初期化（クォータ推定の更新も未保存の変更として扱う）
+        self.quota = QuotaManager(self.meta, on_change=self.mark_dirty)
 
     def save(self) -> None:
-        """meta.json を保存する。更新日時を自動で進める。"""
+        """
+        meta.json を保存する。更新日時を自動で進める。
+
+        一時ファイルに書き出してから os.replace で置き換えるので、
+        書き込み途中で落ちても meta.json が壊れることはない。
+        保存後は取り込み済みの追記ログを削除する（コンパクション）。
+
+        前回の保存（またはロード）から何も変わっていなければ書き込まない
+        （updated_at だけが進んだ meta.json を作らない）。
+        """
         if not self.meta:
             return
 
+        with self._lock:
+            if not self._dirty and self.path.exists():
+                return
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        """save() の本体。self._lock を取得した状態で呼ぶこと。"""
         self.meta["updated_at"] = _now_iso()
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("w", encoding="utf-8") as f:
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
             json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+        # ここまでの追記は meta.json に入ったのでログは不要。
+        # 削除前に落ちても、log_seq 以下の行は再生時に読み飛ばされる。
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+        try:
+            self.log_path.unlink()
+        except FileNotFoundError:
+            pass
+        self._log_events = 0
+
+    def schedule_save(self, delay: float = COMPACT_INTERVAL_SECONDS) -> None:
+        """
+        delay 秒後に保存するよう予約する。
+
+        解答ごとの変更は追記ログで永続化済みなので、
+        meta.json 全体の書き出しは予約中の変更をまとめて 1 回で行う。
+        すでに予約済みならそのタイマーに任せる。
+        """
+        with self._lock:
+            if self._save_timer is not None and self._save_timer.is_alive():
+                return
+            timer = threading.Timer(delay, self._flush_if_dirty)
+            timer.daemon = True
+            self._save_timer = timer
+            timer.start()
+
+    def mark_dirty(self) -> None:
+        """meta の内容を直接書き換えたときに呼び、次回の保存対象にする。"""
+        self._dirty = True
+
+    def _flush_if_dirty(self) -> None:
+        """未保存の変更がある場合だけ save() する。"""
+        if self._dirty:
+            self.save()
 
     # ------------------------------------------------------------------
     # 内部構造の補完
@@ -120,8 +217,10 @@ class MetaManager:
         m = self.meta
 
         m.setdefault("version", 1)
-        m.setdefault("created_at", _now_iso())
-        m.setdefault("updated_at", _now_iso())
+        if "created_at" not in m or "updated_at" not in m:
+            now = _now_iso()
+            m.setdefault("created_at", now)
+            m.setdefault("updated_at", now)
         m.setdefault("usage", {})
         m.setdefault("quota_estimate", {})
         m.setdefault("chapter_stats", {})
@@ -143,6 +242,66 @@ class MetaManager:
         if not isinstance(m["chapter_stats"], dict):
             m["chapter_stats"] = {}
 
+        if not isinstance(m.get("log_seq"), int):
+            m["log_seq"] = 0
+
+    def _replay_log(self) -> None:
+        """
+        追記ログのうち、meta.json に未反映（seq > log_seq）の行を再生する。
+        壊れた行（書き込み途中で落ちた末尾など）は読み飛ばす。
+        """
+        if not self.log_path.exists():
+            return
+
+        applied = self.meta["log_seq"]
+        events = 0
+        with self.log_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                    seq = int(event["seq"])
+                    chapter_id = event["chap"]
+                    source = event["src"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if seq <= applied:
+                    continue
+                self._apply_usage(chapter_id, source)
+                self.meta["log_seq"] = seq
+                events += 1
+
+        if events:
+            self._dirty = True
+        self._log_events = events
+
+    def _build_chapter_index(self) -> None:
+        """
+        meta["chapters"] から subchapter label の一覧と、
+        subchapter label -> 大分類 label の dict を作る。
+        """
+        labels: List[str] = []
+        index: Dict[str, str] = {}
+        chapters = self.meta.get("chapters", {})
+        if isinstance(chapters, dict):
+            for group_val in chapters.values():
+                if not isinstance(group_val, dict):
+                    continue
+                subchapters = group_val.get("subchapters", {})
+                if not isinstance(subchapters, dict):
+                    continue
+                group_label = group_val.get("label")
+                for sub_val in subchapters.values():
+                    if not isinstance(sub_val, dict):
+                        continue
+                    label = sub_val.get("label")
+                    if not isinstance(label, str):
+                        continue
+                    labels.append(label)
+                    if isinstance(group_label, str):
+                        index[label] = group_label
+        self._chapter_labels = labels
+        self._label_to_group = index
+
     # ------------------------------------------------------------------
     # usage / chapter_stats の更新
     # ------------------------------------------------------------------
@@ -155,6 +314,18 @@ class MetaManager:
         source:
             "online" または "offline"
         """
+        with self._lock:
+            self._apply_usage(chapter_id, source)
+            self._dirty = True
+            self.revision += 1
+            self._append_log(chapter_id, source)
+
+            # ログがたまったら meta.json に取り込む
+            if self._log_events >= COMPACT_EVERY_EVENTS:
+                self._save_locked()
+
+    def _apply_usage(self, chapter_id: str, source: str) -> None:
+        """usage / chapter_stats / last_chapter_id をメモリ上で更新する。"""
         usage = self.meta["usage"]
 
         usage["total_questions"] += 1
@@ -180,36 +351,52 @@ class MetaManager:
         # 最後に出題した章として記録
         self.meta["last_chapter_id"] = chapter_id
 
+    def _append_log(self, chapter_id: str, source: str) -> None:
+        """追記ログに 1 行書き込む。self._lock を取得した状態で呼ぶこと。"""
+        if self._log_file is None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._log_file = self.log_path.open("a", encoding="utf-8", buffering=8192)
+
+        seq = self.meta["log_seq"] + 1
+        self.meta["log_seq"] = seq
+        # ts は UNIX 秒。解答ごとに datetime を組み立てて書式化しない
+        event = {"seq": seq, "chap": chapter_id, "src": source, "ts": int(time.time())}
+        # 機械しか読まない行なので、区切りの空白も省いて書く
+        self._log_file.write(
+            json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+        )
+        # 1 行（数十バイト）ずつ OS に渡しておき、プロセスが落ちても失わない
+        self._log_file.flush()
+        self._log_events += 1
+
     # ------------------------------------------------------------------
     # 章バランス制御
     # ------------------------------------------------------------------
     def get_all_chapter_labels(self) -> List[str]:
         """
         meta["chapters"] から、シラバス上の全ての subchapter の label を抽出する。
+        （load() 時に作った一覧のコピーを返す）
 
         戻り値の例:
             ["1. 人工知能の定義", "2. 人工知能分野で議論される問題", ...]
         """
-        chapters = self.meta.get("chapters", {})
-        labels: List[str] = []
-
-        if not isinstance(chapters, dict):
-            return labels
+        return list(self._chapter_labels)
 
-        for _group_key, group_val in chapters.items():
-            subchapters = group_val.get("subchapters", {})
-            if not isinstance(subchapters, dict):
-                continue
-            for _sub_key, sub_val in subchapters.items():
-                label = sub_val.get("label")
-                if isinstance(label, str):
-                    labels.append(label)
-
-        return labels
+    def get_chapter_group(
+        self,
+        chapter_label: str,
+        default: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        subchapter の label（例: "1. 人工知能の定義"）から、
+        所属する大分類の label（例: "人工知能とは"）を返す。
+        見つからなければ default。
+        """
+        return self._label_to_group.get(chapter_label, default)
 
     def choose_next_chapter(
         self,
-        available_chapter_ids: List[str],
+        available_chapter_ids: Sequence[str],
         avoid_same_as_last: bool = True,
     ) -> Optional[str]:
         """
@@ -229,14 +416,19 @@ class MetaManager:
         if not available_chapter_ids:
             return None
 
+        # 所属判定は set で行う（リストの線形探索を繰り返さない）
+        available = set(available_chapter_ids)
+
         # シラバスに定義されている章から、利用可能なものだけに絞る
         syllabus_labels = self.get_all_chapter_labels()
-        candidates = [c for c in syllabus_labels if c in available_chapter_ids]
+        candidates = [c for c in syllabus_labels if c in available]
 
         # シラバス側に定義が無いが、問題は存在する章も一応含める
+        seen = set(candidates)
         for cid in available_chapter_ids:
-            if cid not in candidates:
+            if cid not in seen:
                 candidates.append(cid)
+                seen.add(cid)
 
         if not candidates:
             return None
@@ -249,14 +441,17 @@ class MetaManager:
                 return int(v.get("total_questions", 0))
             return 0
 
-        # 最小出題回数を求める
-        totals = [total_for(c) for c in candidates]
-        if not totals:
-            return None
-        min_total = min(totals)
-
-        # その最小値を持つ章だけ残す
-        least_used = [c for c in candidates if total_for(c) == min_total]
+        # 1 回の走査で、最小出題回数とその回数を持つ章を集める
+        # （章ごとの出題回数は 1 度だけ引く）
+        least_used: List[str] = []
+        min_total: Optional[int] = None
+        for c in candidates:
+            total = total_for(c)
+            if min_total is None or total < min_total:
+                min_total = total
+                least_used = [c]
+            elif total == min_total:
+                least_used.append(c)
 
         last_chapter = self.meta.get("last_chapter_id")
         if (
@@ -277,7 +472,7 @@ class MetaManager:
         load() 済みであることが前提。
         """
         if self.quota is None:
-            self.quota = QuotaManager(self.meta)
+            self.quota = QuotaManager(self.meta, on_change=self.mark_dirty)
         return self.quota
 
     def get_quota_status(self) -> Dict[str, Any]:
@@ -25,6 +25,9 @@ QuestionSource = Literal["online", "offline"]
 QuestionDifficulty = Literal["basic", "standard", "advanced"]
 ModeType = Literal["auto", "online", "offline"]
 
+# 1問あたりの選択肢の数（四択）
+CHOICE_COUNT = 4
+
 
 # ----------------------------------------------------------------------
 #  1問分のモデル（question_bank.jsonl と 1:1 で対応）
@@ -67,6 +70,9 @@ class Question:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Question":
         """辞書から Question を生成（不足キーがあれば例外をそのまま投げる）"""
+        # choices は JSON の配列だけを受け付ける。文字列に list() を掛けると
+        # 1 文字ずつの選択肢になってしまうので、配列以外は空にして is_valid() で弾く
+        raw_choices = data.get("choices", [])
         return cls(
             id=data["id"],
             source=data.get("source", "unknown"),
@@ -76,7 +82,7 @@ class Question:
             chapter_id=data.get("chapter_id", ""),
             difficulty=data.get("difficulty", "standard"),
             question=data.get("question", ""),
-            choices=list(data.get("choices", [])),
+            choices=list(raw_choices) if isinstance(raw_choices, list) else [],
             correct_index=int(data.get("correct_index", 0)),
             explanation=data.get("explanation", ""),
             syllabus=data.get("syllabus", ""),
@@ -86,6 +92,23 @@ class Question:
         """JSONL 互換の dict に変換"""
         return asdict(self)
 
+    def is_valid(self) -> bool:
+        """
+        出題できる形になっているかを判定する。
+        - id と chapter_id が文字列（問題バンクの索引のキーに使うため）
+        - 問題文が空でない
+        - 選択肢がちょうど CHOICE_COUNT 個で、どれも空でない文字列
+        - correct_index が選択肢の範囲内
+        """
+        return (
+            isinstance(self.id, str)
+            and isinstance(self.chapter_id, str)
+            and bool(self.question)
+            and len(self.choices) == CHOICE_COUNT
+            and all(isinstance(c, str) and c for c in self.choices)
+            and 0 <= self.correct_index < CHOICE_COUNT
+        )
+
     def is_correct(self, choice_index: int) -> bool:
         """選択肢インデックスが正解かどうか"""
         return choice_index == self.correct_index
@@ -154,6 +177,7 @@ class SessionState:
     - source            : 現在の問題が online / offline のどちら由来か
     - model_name        : online 時に使用したモデル名（オフラインなら None）
     - history           : セッション中の解答履歴
+    - wrong_indices     : history のうち不正解だったレコードの位置（answer() で追記）
     """
 
     mode: ModeType = "auto"
@@ -163,6 +187,7 @@ class SessionState:
     source: QuestionSource = "offline"
     model_name: Optional[str] = None
     history: List[AnswerRecord] = field(default_factory=list)
+    wrong_indices: List[int] = field(default_factory=list)
 
     # --------------------------------------------------
     #  セッション操作
@@ -202,6 +227,8 @@ class SessionState:
             correct=correct,
             source=self.source,
         )
+        if not correct:
+            self.wrong_indices.append(len(self.history))
         self.history.append(record)
         return correct
 
@@ -223,6 +250,7 @@ class SessionState:
                 self.current_question.to_dict() if self.current_question else None
             ),
             "history": [r.to_dict() for r in self.history],
+            "wrong_indices": list(self.wrong_indices),
         }
         return data
 
@@ -242,6 +270,15 @@ class SessionState:
                 if isinstance(item, dict):
                     history.append(AnswerRecord.from_dict(item))
 
+        # wrong_indices が無い（古い形式の）データは history から作り直す
+        wrong_data = data.get("wrong_indices")
+        if isinstance(wrong_data, list) and all(
+            isinstance(i, int) and 0 <= i < len(history) for i in wrong_data
+        ):
+            wrong_indices = list(wrong_data)
+        else:
+            wrong_indices = [i for i, r in enumerate(history) if not r.correct]
+
         return cls(
             mode=data.get("mode", "auto"),
             current_question=question,
@@ -250,4 +287,5 @@ class SessionState:
             source=data.get("source", "offline"),
             model_name=data.get("model_name"),
             history=history,
+            wrong_indices=wrong_indices,
         )
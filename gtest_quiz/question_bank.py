@@ -17,15 +17,31 @@ from __future__ import annotations
 import json
 import random
 from pathlib import Path
-from typing import Dict, List, Optional, Iterable
+from typing import Dict, List, Optional, Iterable, Tuple
 
 from .models import Question
 
+# JSON パースは orjson があればそちらを使う（C/Rust 実装で標準 json より高速）。
+# どちらも bytes をそのまま受け取れるので、行ごとに str へデコードしない。
+try:
+    import orjson  # type: ignore[import]
+
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson は任意依存
+    _json_loads = json.loads
+
 # ----------------------------------------------------------------------
 #  グローバルキャッシュ（Pythonプロセス中は維持される）
 # ----------------------------------------------------------------------
 _QUESTION_CACHE: Dict[str, Question] = {}
-_IS_LOADED = False
+# ロード時に作る索引: 全問題のタプルと、chapter_id -> 問題タプル
+_ALL_QUESTIONS: Tuple[Question, ...] = ()
+_CHAPTER_INDEX: Dict[str, Tuple[Question, ...]] = {}
+# キャッシュ構築時の question_bank.jsonl の更新時刻（未ロードなら None）
+_LOADED_MTIME_NS: Optional[int] = None
+
+# 出題用の乱数生成器（モジュールで 1 つだけ持ち、呼び出しごとに作り直さない）
+_rng = random.Random()
 
 # ----------------------------------------------------------------------
 #  パス定義
@@ -36,16 +52,28 @@ BANK_PATH = Path("bank/question_bank.jsonl")
 # ----------------------------------------------------------------------
 #  JSONL 読み込み
 # ----------------------------------------------------------------------
+def bank_mtime_ns() -> int:
+    """question_bank.jsonl の更新時刻（ns）。ファイルが無ければ 0。キャッシュキー用。"""
+    try:
+        return BANK_PATH.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
 def load_question_bank(force_reload: bool = False) -> Dict[str, Question]:
     """
     question_bank.jsonl を読み込み、id をキーとする Question 辞書を返す。
 
-    - force_reload=True の場合のみ再読込
-    - 壊れた行は安全にスキップ（print などは行わない）
+    - ファイルの更新時刻が前回ロード時と同じならキャッシュを返す
+      （auto_refill などで追記されたときだけ再読込）
+    - force_reload=True の場合は常に再読込
+    - 壊れた行・出題できない問題（Question.is_valid() が False）は
+      安全にスキップ（print などは行わない）。表示側では再検証しない
     """
-    global _IS_LOADED, _QUESTION_CACHE
+    global _LOADED_MTIME_NS, _QUESTION_CACHE, _ALL_QUESTIONS, _CHAPTER_INDEX
 
-    if _IS_LOADED and not force_reload:
+    mtime_ns = bank_mtime_ns()
+    if _LOADED_MTIME_NS == mtime_ns and not force_reload:
         return _QUESTION_CACHE
 
     if not BANK_PATH.exists():
@@ -53,22 +81,34 @@ def load_question_bank(force_reload: bool = False) -> Dict[str, Question]:
 
     cache: Dict[str, Question] = {}
 
-    with BANK_PATH.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-
-            try:
-                data = json.loads(line)
-                q = Question.from_dict(data)
-                cache[q.id] = q
-            except Exception:
-                # 壊れた行は無視する
-                continue
+    # テキストモードの行読み込みではなく、一括で bytes として読んで分割する
+    raw = BANK_PATH.read_bytes()
+    for line in raw.split(b"\n"):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            data = _json_loads(line)
+            q = Question.from_dict(data)
+        except (ValueError, TypeError, KeyError):
+            # 壊れた行（JSON として読めない / dict でない / id が無いなど）は無視する。
+            # orjson.JSONDecodeError・json.JSONDecodeError はどちらも ValueError の派生。
+            continue
+        # is_valid() は id / chapter_id が文字列であることも確かめるので、
+        # 索引に入れる時点でキーがハッシュできない行はここで落ちる
+        if q.is_valid():
+            cache[q.id] = q
+
+    # 章ごとの問題は出題のたびに全件を走査しないよう、ここでまとめて振り分けておく
+    by_chapter: Dict[str, List[Question]] = {}
+    for q in cache.values():
+        by_chapter.setdefault(q.chapter_id, []).append(q)
 
     _QUESTION_CACHE = cache
-    _IS_LOADED = True
+    _ALL_QUESTIONS = tuple(cache.values())
+    _CHAPTER_INDEX = {cid: tuple(qs) for cid, qs in by_chapter.items()}
+    _LOADED_MTIME_NS = mtime_ns
     return cache
 
 
@@ -77,7 +117,8 @@ def load_question_bank(force_reload: bool = False) -> Dict[str, Question]:
 # ----------------------------------------------------------------------
 def get_all_questions() -> List[Question]:
     """全問題のリスト"""
-    return list(load_question_bank().values())
+    load_question_bank()
+    return list(_ALL_QUESTIONS)
 
 
 def get_question_by_id(qid: str) -> Optional[Question]:
@@ -86,11 +127,9 @@ def get_question_by_id(qid: str) -> Optional[Question]:
 
 
 def get_questions_by_chapter(chapter_id: str) -> List[Question]:
-    """章（chapter_id）の完全一致でフィルタ"""
-    return [
-        q for q in load_question_bank().values()
-        if q.chapter_id == chapter_id
-    ]
+    """章（chapter_id）の完全一致でフィルタ（ロード時に作った索引を引くだけ）"""
+    load_question_bank()
+    return list(_CHAPTER_INDEX.get(chapter_id, ()))
 
 
 def get_questions_by_group(group_name: str) -> List[Question]:
@@ -109,10 +148,11 @@ def pick_random_question() -> Question:
     単純にランダムで 1問返す。
     必ず Question を返す。0件なら例外。
     """
-    bank = get_all_questions()
+    load_question_bank()
+    bank = _ALL_QUESTIONS
     if not bank:
         raise ValueError("問題バンクが空です。")
-    return random.choice(bank)
+    return bank[_rng.randrange(len(bank))]
 
 
 # ----------------------------------------------------------------------
@@ -122,10 +162,11 @@ def pick_random_from_chapter(chapter_id: str) -> Optional[Question]:
     """
     章内からランダム出題。0件なら None。
     """
-    items = get_questions_by_chapter(chapter_id)
+    load_question_bank()
+    items = _CHAPTER_INDEX.get(chapter_id)
     if not items:
         return None
-    return random.choice(items)
+    return items[_rng.randrange(len(items))]
 
 
 # ----------------------------------------------------------------------
@@ -19,12 +19,42 @@ Google Gemini API の「推定クォータメーター」を管理するモジ
   その時点の total_used_tokens から「推定上限」を更新
 - 使えば使うほど estimated_limit_tokens が洗練されていく
 - UI 側からは「どのくらい危ない状態か」を問い合わせ可能
+- 直近 60 秒間の呼び出し回数（2 バケットのスライディングウィンドウで近似）を数え、
+  RPM 上限を超えないように抑制
+- 429 の応答に含まれる retryDelay を尊重し、その間はオンライン出題を止める
 """
 
 from __future__ import annotations
 
+import random
+import re
+import threading
 import time
-from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+# RPM（1 分あたりのリクエスト数）を数える窓の長さ（秒）
+RPM_WINDOW_SECONDS = 60.0
+
+# retryDelay に上乗せする余裕（秒）
+RETRY_DELAY_BUFFER_SECONDS = 1.5
+
+# 429 が続いたときの指数バックオフ: min(BASE * 2**n, MAX) + jitter（秒）
+BACKOFF_BASE_SECONDS = 30.0
+BACKOFF_MAX_SECONDS = 600.0
+BACKOFF_JITTER_SECONDS = 5.0
+
+# 429 のメッセージから再試行までの待ち時間（秒）を取り出すパターン。
+# REST の JSON 形式 / gRPC の RetryInfo 形式 / 本文中の案内文に対応する。
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"'),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"[Pp]lease retry in (\d+(?:\.\d+)?)s"),
+)
+
+# 日次クォータ（RPD）の枯渇を示す識別子の一部
+# 例: GenerateRequestsPerDayPerProjectPerModel-FreeTier
+_DAILY_QUOTA_MARKER = "PerDay"
 
 
 class QuotaManager:
@@ -32,11 +62,18 @@ class QuotaManager:
     meta.json 内の quota_estimate をラップして扱うクラス。
     """
 
-    def __init__(self, meta_ref: Dict[str, Any]):
+    def __init__(
+        self,
+        meta_ref: Dict[str, Any],
+        on_change: Optional[Callable[[], None]] = None,
+    ):
         """
         meta_ref: bank/meta.json を読み込んだ dict そのものを参照で受け取る。
+        on_change: quota_estimate を書き換えたときに呼ぶコールバック
+                   （MetaManager が未保存の変更として扱うために使う）。
         """
         self.meta_ref = meta_ref
+        self._on_change = on_change
 
         if "quota_estimate" not in self.meta_ref:
             self.meta_ref["quota_estimate"] = {}
@@ -49,6 +86,21 @@ class QuotaManager:
 
         self._q = q  # 参照を保持
 
+        # 先読みスレッドや auto_refill のワーカーからも更新されるため、
+        # 状態を書き換えるメソッドはこのロックの中で行う。
+        # register_429 から block_for を呼ぶので再入可能なロックにする。
+        self._lock = threading.RLock()
+
+        # RPM 制御用のスライディングウィンドウカウンタ（meta.json には保存しない）。
+        # 現在の窓と 1 つ前の窓の呼び出し回数だけを持つ。
+        self._window_start = 0.0  # time.monotonic()
+        self._prev_count = 0
+        self._curr_count = 0
+        # この時刻 (time.monotonic()) まではオンライン出題を行わない
+        self._blocked_until = 0.0
+        # 指数バックオフの段数。429 で +1、成功で半減（AIMD）
+        self._backoff_level = 0.0
+
     # ------------------------------------------------------------------
     # 使用量の更新
     # ------------------------------------------------------------------
@@ -61,7 +113,70 @@ class QuotaManager:
         """
         if used_tokens < 0:
             used_tokens = 0
-        self._q["total_used_tokens"] += used_tokens
+        with self._lock:
+            self._q["total_used_tokens"] += used_tokens
+            self._changed()
+
+    def _changed(self) -> None:
+        """quota_estimate を更新したことを所有者に通知する。"""
+        if self._on_change is not None:
+            self._on_change()
+
+    # ------------------------------------------------------------------
+    # RPM（1 分あたりのリクエスト数）の制御
+    # ------------------------------------------------------------------
+    def _roll_window(self, now: float) -> None:
+        """
+        now が現在の窓を過ぎていれば、窓を進めてカウンタを繰り越す。
+        self._lock を取得した状態で呼ぶこと。
+        """
+        start = self._window_start
+        elapsed = now - start
+        if elapsed < RPM_WINDOW_SECONDS:
+            return
+
+        windows = int(elapsed // RPM_WINDOW_SECONDS)
+        # ちょうど 1 窓分進んだときだけ現在の窓が「1 つ前」になる
+        self._prev_count = self._curr_count if windows == 1 else 0
+        self._curr_count = 0
+        self._window_start = start + windows * RPM_WINDOW_SECONDS
+
+    def record_request(self, now: Optional[float] = None) -> None:
+        """
+        API を 1 回呼び出したことを記録する。
+        成否にかかわらずリクエスト枠は消費されるので、呼び出し直前に使う。
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._roll_window(now)
+            self._curr_count += 1
+
+    def is_rate_limited(self, rpm_limit: int, now: Optional[float] = None) -> bool:
+        """
+        直近 60 秒間のリクエスト数（推定）が rpm_limit に達していれば True を返す。
+        rpm_limit が 0 以下なら制限しない。
+
+        推定値 = 前の窓の回数 × 前の窓が直近 60 秒に重なる割合 + 現在の窓の回数
+        """
+        if rpm_limit <= 0:
+            return False
+
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._roll_window(now)
+            overlap = 1.0 - (now - self._window_start) / RPM_WINDOW_SECONDS
+            estimated = self._prev_count * overlap + self._curr_count
+        return estimated >= rpm_limit
+
+    def register_success(self) -> None:
+        """
+        API 呼び出しが成功したときに呼び出す。
+        バックオフの段数を半分に戻す（429 が出なくなれば徐々に待ち時間が縮む）。
+        """
+        with self._lock:
+            self._backoff_level *= 0.5
 
     # ------------------------------------------------------------------
     # 429 エラー時の処理
@@ -74,19 +189,60 @@ class QuotaManager:
         - last_error にメッセージを保存
         - この時点の total_used_tokens をもとに estimated_limit_tokens を更新
           (今までの推定より大きければ上書きする)
+        - 指数バックオフ（ジッター付き）と retryDelay のうち長い方だけ待つ
         """
         now_iso = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-        self._q["last_429_at"] = now_iso
-        if message:
-            self._q["last_error"] = message
+        with self._lock:
+            self._q["last_429_at"] = now_iso
+            if message:
+                self._q["last_error"] = message
 
-        total = self._q.get("total_used_tokens", 0)
-        limit = self._q.get("estimated_limit_tokens")
+            total = self._q.get("total_used_tokens", 0)
+            limit = self._q.get("estimated_limit_tokens")
+
+            # まだ上限が無い、あるいは前回推定より多い使用量で 429 が出た場合、
+            # 「新たに観測された上限」として更新する。
+            if limit is None or (isinstance(limit, (int, float)) and total > limit):
+                self._q["estimated_limit_tokens"] = total
+            self._changed()
+
+            # 連続した 429 ほど長く待つ。ジッターで複数セッションの再試行を分散させる。
+            backoff = min(
+                BACKOFF_BASE_SECONDS * 2 ** self._backoff_level, BACKOFF_MAX_SECONDS
+            )
+            self.block_for(backoff + random.uniform(0.0, BACKOFF_JITTER_SECONDS))
+            self._backoff_level += 1.0
+
+            if not message:
+                return
+
+            # 日次クォータ切れなら、リセットされるまでオンラインを止める。
+            # それ以外（分単位の制限）は retryDelay の指示に従って待つ。
+            if _DAILY_QUOTA_MARKER in message:
+                self.block_for(_seconds_until_daily_reset())
+            else:
+                delay = parse_retry_delay(message)
+                if delay is not None:
+                    self.block_for(delay + RETRY_DELAY_BUFFER_SECONDS)
+
+    # ------------------------------------------------------------------
+    # 一時停止（429 後のクールダウン）
+    # ------------------------------------------------------------------
+    def block_for(self, seconds: float, now: Optional[float] = None) -> None:
+        """
+        seconds 秒間オンライン呼び出しを止める。
+        既により長く止めている場合はそちらを優先する。
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, now + max(seconds, 0.0))
 
-        # まだ上限が無い、あるいは前回推定より多い使用量で 429 が出た場合、
-        # 「新たに観測された上限」として更新する。
-        if limit is None or (isinstance(limit, (int, float)) and total > limit):
-            self._q["estimated_limit_tokens"] = total
+    def is_blocked(self, now: Optional[float] = None) -> bool:
+        """429 後のクールダウン中なら True を返す。"""
+        if now is None:
+            now = time.monotonic()
+        return now < self._blocked_until
 
     # ------------------------------------------------------------------
     # 一般エラー
@@ -95,7 +251,9 @@ class QuotaManager:
         """
         429 以外のエラーでも、様子を記録したい場合に利用する。
         """
-        self._q["last_error"] = message
+        with self._lock:
+            self._q["last_error"] = message
+            self._changed()
 
     # ------------------------------------------------------------------
     # 状態参照
@@ -140,3 +298,36 @@ class QuotaManager:
 
         ratio = total / float(limit)
         return ratio >= threshold
+
+
+# ----------------------------------------------------------------------
+# ユーティリティ
+# ----------------------------------------------------------------------
+def parse_retry_delay(message: str) -> Optional[float]:
+    """
+    429 のエラーメッセージから RetryInfo.retryDelay（秒）を取り出す。
+    見つからなければ None を返す。
+    """
+    for pattern in _RETRY_DELAY_PATTERNS:
+        m = pattern.search(message)
+        if m:
+            return float(m.group(1))
+    return None
+
+
+def _seconds_until_daily_reset() -> float:
+    """
+    Gemini API の日次クォータがリセットされる（太平洋時間の 0 時）までの秒数。
+    タイムゾーン情報が使えない環境では 24 時間とみなす。
+    """
+    try:
+        from zoneinfo import ZoneInfo
+
+        now = datetime.now(ZoneInfo("America/Los_Angeles"))
+    except Exception:
+        return 24 * 60 * 60.0
+
+    next_reset = (now + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return (next_reset - now).total_seconds()
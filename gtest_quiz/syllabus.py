@@ -18,6 +18,11 @@ from dataclasses import dataclass
 from typing import List, Dict
 
 
+# domain（大区分）のラベル
+TECH_DOMAIN_LABEL = "技術分野"
+LAW_DOMAIN_LABEL = "法律・倫理分野"
+
+
 # ============================================================
 # データ構造
 # ============================================================
@@ -13,12 +13,13 @@ Streamlit ベースの UI コンポーネントをまとめたモジュール。
 ここでは「見た目」と「ユーザー操作の入力」を扱い、
 問題選択ロジックやメタ情報更新などのビジネスロジックは app.py 側に任せる。
 
-戻り値として「何が押されたか」「どの選択肢が新たに選ばれたか」を返す。
+ボタンが押されたときの処理は、呼び出し側から on_click コールバックとして受け取る。
 """
 
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+import functools
+from typing import Any, Callable, Dict, Optional
 
 import streamlit as st
 
@@ -63,11 +64,32 @@ THEMES: Dict[str, Dict[str, str]] = {
 }
 
 
+# テーマ切替ラジオの選択肢・表示名・位置（描画のたびに作り直さない）
+_THEME_OPTIONS = tuple(THEMES)
+_THEME_LABELS: Dict[str, str] = {"light": "Light", "dark": "Dark", "blue": "Blue"}
+_THEME_INDEX: Dict[str, int] = {k: i for i, k in enumerate(_THEME_OPTIONS)}
+
+
+def _theme_label(key: str) -> str:
+    return _THEME_LABELS.get(key, key)
+
+
+# 選択肢ボタンに当てる class 属性（回答状態ごとに固定）
+_CHOICE_CLASS = "gq-choice-btn"
+_CHOICE_CLASS_CORRECT = "gq-choice-btn gq-choice-correct"
+_CHOICE_CLASS_INCORRECT = "gq-choice-btn gq-choice-incorrect"
+
+
 # ----------------------------------------------------------------------
 #  CSS 生成
 # ----------------------------------------------------------------------
-def _generate_css(theme: Dict[str, str]) -> str:
-    """テーマに応じたグローバル CSS を生成する。"""
+@functools.lru_cache(maxsize=None)
+def _generate_css(theme_key: str) -> str:
+    """
+    テーマに応じたグローバル CSS を生成する。
+    rerun のたびに同じ文字列を組み立て直さないよう、テーマごとに 1 回だけ作る。
+    """
+    theme = THEMES[theme_key]
 
     return f"""
     <style>
@@ -258,17 +280,13 @@ def _ensure_theme() -> str:
 def _render_theme_selector(theme_key: str) -> str:
     """ヘッダーの右上あたりにテーマ切替を表示し、選択されたテーマキーを返す。"""
     # Streamlit の radio を横並びで使用
-    options = ["light", "dark", "blue"]
-    labels = {"light": "Light", "dark": "Dark", "blue": "Blue"}
-
-    idx = options.index(theme_key) if theme_key in options else 0
     selected = st.radio(
         "テーマ",
-        options,
-        index=idx,
+        _THEME_OPTIONS,
+        index=_THEME_INDEX.get(theme_key, 0),
         horizontal=True,
         label_visibility="collapsed",
-        format_func=lambda k: labels.get(k, k),
+        format_func=_theme_label,
     )
     st.session_state["theme"] = selected
     return selected
@@ -283,9 +301,13 @@ def render_quiz_page(
     progress_ratio: Optional[float] = None,
     quota_status: Optional[Dict[str, Any]] = None,
     mode_label: str = "AUTO",
-) -> Dict[str, Any]:
+    on_choice: Optional[Callable[[int], None]] = None,
+    on_next: Optional[Callable[[], None]] = None,
+    on_prev: Optional[Callable[[], None]] = None,
+    on_change_chapter: Optional[Callable[[], None]] = None,
+) -> None:
     """
-    クイズページ全体を描画し、ユーザー操作の結果を返す。
+    クイズページ全体を描画する。ボタン操作は on_* コールバックで呼び出し側に伝える。
 
     引数:
         session:
@@ -298,37 +320,21 @@ def render_quiz_page(
             total_used_tokens / estimated_limit_tokens / last_429_at / last_error
         mode_label:
             画面上に表示するモード表記 (例: "ONLINE", "OFFLINE", "AUTO")。
-
-    戻り値:
-        {
-          "selected_choice": Optional[int],   # 新たに押された選択肢 index (なければ None)
-          "clicked_next": bool,
-          "clicked_prev": bool,
-          "clicked_change_chapter": bool,
-          "theme": str,                       # 現在のテーマキー
-        }
+        on_choice / on_next / on_prev / on_change_chapter:
+            各ボタンの on_click コールバック（任意）。
+            コールバックはスクリプトの再実行より前に呼ばれるので、
+            その結果（回答済みの表示や次の問題）が同じ再実行でそのまま描画される。
+            on_choice には選択肢の index が渡される（未回答のときだけ呼ばれる）。
     """
     # セーフティ: 問題がない場合
     if not isinstance(session.current_question, Question):
         st.error("問題がまだ選択されていません。")
-        return {
-            "selected_choice": None,
-            "clicked_next": False,
-            "clicked_prev": False,
-            "clicked_change_chapter": False,
-            "theme": _ensure_theme(),
-        }
+        return
 
     # テーマ決定と CSS 注入
     theme_key = _ensure_theme()
     theme = THEMES[theme_key]
-    st.markdown(_generate_css(theme), unsafe_allow_html=True)
-
-    # 操作結果の初期値
-    selected_choice: Optional[int] = None
-    clicked_next = False
-    clicked_prev = False
-    clicked_change_chapter = False
+    st.markdown(_generate_css(theme_key), unsafe_allow_html=True)
 
     q = session.current_question
 
@@ -411,25 +417,23 @@ def render_quiz_page(
     correct_index = q.correct_index if session.is_correct is not None else None
 
     for idx, choice_text in enumerate(q.choices):
-        classes = ["gq-choice-btn"]
-
+        class_attr = _CHOICE_CLASS
         if answered_index is not None and correct_index is not None:
             if idx == correct_index:
-                classes.append("gq-choice-correct")
-            elif idx == answered_index and answered_index != correct_index:
-                classes.append("gq-choice-incorrect")
+                class_attr = _CHOICE_CLASS_CORRECT
+            elif idx == answered_index:
+                class_attr = _CHOICE_CLASS_INCORRECT
 
-        class_attr = " ".join(classes)
         button_html = f"<button class='{class_attr}'>{choice_text}</button>"
 
-        if st.button(
+        # 未回答時のみ「新たな選択」として on_choice を呼ぶ
+        st.button(
             choice_text,
             key=f"gq_choice_{idx}",
             use_container_width=True,
-        ):
-            # 未回答時のみ「新たな選択」として扱う
-            if answered_index is None:
-                selected_choice = idx
+            on_click=on_choice if answered_index is None else None,
+            args=(idx,),
+        )
 
         # 上記 st.button 用に class を当てるための HTML を後追いで描画（視覚のみ）
         st.markdown(
@@ -452,16 +456,18 @@ def render_quiz_page(
     # ----------------------------------------
     col_prev, col_next = st.columns(2)
     with col_prev:
-        if st.button("◀ ひとつ前", key="gq_prev", use_container_width=True):
-            clicked_prev = True
+        st.button("◀ ひとつ前", key="gq_prev", use_container_width=True, on_click=on_prev)
     with col_next:
-        if st.button("次の問題 ▶", key="gq_next", use_container_width=True):
-            clicked_next = True
+        st.button("次の問題 ▶", key="gq_next", use_container_width=True, on_click=on_next)
 
     col_change, col_dummy = st.columns([1, 1])
     with col_change:
-        if st.button("章を変える", key="gq_change_chapter", use_container_width=True):
-            clicked_change_chapter = True
+        st.button(
+            "章を変える",
+            key="gq_change_chapter",
+            use_container_width=True,
+            on_click=on_change_chapter,
+        )
 
     # フッター
     st.markdown(
@@ -475,14 +481,6 @@ def render_quiz_page(
     st.markdown("<div class='gq-safe-bottom'></div>", unsafe_allow_html=True)
     st.markdown("</div>", unsafe_allow_html=True)
 
-    return {
-        "selected_choice": selected_choice,
-        "clicked_next": clicked_next,
-        "clicked_prev": clicked_prev,
-        "clicked_change_chapter": clicked_change_chapter,
-        "theme": st.session_state.get("theme", theme_key),
-    }
-
 
 # ----------------------------------------------------------------------
 #  クォータメーター描画
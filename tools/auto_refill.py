@@ -9,6 +9,7 @@ bank/question_bank.jsonl に自動的に問題を追加するスクリプト。
 - bank/meta.json を読み込む (MetaManager)
 - question_bank.jsonl を読み込む (QuestionBank)
 - 出題の少ない章を優先して、Google Gemini に問題生成を依頼
+  （--workers で複数の章を同時に生成できる）
 - 生成された問題を JSONL 形式で追記
 - meta.json の usage / chapter_stats / quota_estimate を更新
 
@@ -20,26 +21,46 @@ bank/question_bank.jsonl に自動的に問題を追加するスクリプト。
 from __future__ import annotations
 
 import argparse
+import functools
 import json
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import AbstractSet, Any, Dict, List, Optional
 
 import google.generativeai as genai
 
+from gtest_quiz.generation import (
+    DEFAULT_MAX_OUTPUT_TOKENS,
+    DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    GENERATION_CONFIG,
+    approx_prompt_tokens,
+    build_prompt,
+    build_question,
+    collect_stream_text,
+    is_quota_error,
+    parse_response_json,
+    usage_tokens,
+)
 from gtest_quiz.meta import MetaManager
 from gtest_quiz.models import Question
 from gtest_quiz.question_bank import (
     load_question_bank,
     get_all_questions,
 )
-from gtest_quiz.syllabus import TECH_DOMAIN_LABEL, LAW_DOMAIN_LABEL  # 仮: 必要なら調整
+from gtest_quiz.syllabus import TECH_DOMAIN_LABEL, LAW_DOMAIN_LABEL
 from gtest_quiz.quota import QuotaManager
 
 
 BANK_PATH = Path("bank/question_bank.jsonl")
 
+# 1 分あたりの Gemini 呼び出し回数の上限（config.toml の [quota].rpm と同じ既定値）
+DEFAULT_RPM = 15
+# RPM の上限に達しているとき、次の投入を試みるまでの間隔（秒）
+RPM_POLL_SECONDS = 1.0
+
 
 # -------------------------------------------------------------
 #  Gemini 初期化
@@ -114,9 +135,9 @@ def infer_domain_and_group(meta: Dict[str, Any], chapter_label: str) -> Dict[str
 # -------------------------------------------------------------
 #  question_id の生成
 # -------------------------------------------------------------
-def generate_question_id(chapter_label: str, existing_ids: List[str]) -> str:
+def generate_question_id(chapter_label: str, existing_ids: AbstractSet[str]) -> str:
     """
-    question_bank.jsonl 内の既存 ID を踏まえつつ、
+    question_bank.jsonl 内の既存 ID（と今回すでに割り当てた ID）を踏まえつつ、
     衝突しないシンプルな ID を生成する。
 
     形式:
@@ -125,50 +146,23 @@ def generate_question_id(chapter_label: str, existing_ids: List[str]) -> str:
     ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
     base = f"Q_AUTO_{ts}"
     seq = 1
-    id_set = set(existing_ids)
     while True:
         qid = f"{base}_{seq:02d}"
-        if qid not in id_set:
+        if qid not in existing_ids:
             return qid
         seq += 1
 
 
 # -------------------------------------------------------------
-#  Gemini へ与えるプロンプト
+#  Gemini モデル
 # -------------------------------------------------------------
-def build_prompt(chapter_label: str, chapter_group: str) -> str:
+@functools.lru_cache(maxsize=None)
+def _get_model(model_name: str) -> "genai.GenerativeModel":
     """
-    指定したシラバス中項目 (chapter_label) に対応する
-    G検定レベルの四択問題を 1問生成するためのプロンプト。
+    GenerativeModel をモデル名ごとに 1 つだけ作って使い回す。
+    応答は GENERATION_CONFIG の JSON スキーマに沿う形で返させる。
     """
-    return f"""
-あなたは日本語で G検定(JDLA Deep Learning for GENERAL) の高品質な四択問題を作る専門家です。
-
-以下の制約を厳密に守って、指定されたシラバス項目に対応する四択問題を 1 問だけ生成してください。
-
-# シラバス情報
-- 分野: {chapter_group}
-- 中項目: {chapter_label}
-
-# 出力条件
-- G検定本試験レベルの知識を問う。
-- 純粋な知識問題・概念理解問題・応用イメージ問題をバランス良く含める。
-- 選択肢は必ず 4 つ。紛らわしいが、1つだけ明確に正しい選択肢を含める。
-- 難易度は basic / standard / advanced のいずれかを、内容に応じて自分で決める。
-
-# 出力フォーマット (JSON 1オブジェクトのみ)
-以下のキーを含む JSON オブジェクトとして出力してください:
-
-{{
-  "question": "問題文（文末に「どれか。」などを含めてもよい）",
-  "choices": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"],
-  "correct_index": 0,
-  "explanation": "なぜこれが正しく、他が誤りかを丁寧に解説する。",
-  "difficulty": "basic|standard|advanced"
-}}
-
-絶対に JSON 以外の文字列は出力しないでください。
-"""
+    return genai.GenerativeModel(model_name, generation_config=GENERATION_CONFIG)
 
 
 # -------------------------------------------------------------
@@ -180,72 +174,63 @@ def generate_one_question(
     chapter_group: str,
     meta_dict: Dict[str, Any],
     quota: QuotaManager,
+    qid: str,
 ) -> Optional[Question]:
     """
-    指定した章について問題を 1 問生成し、Question オブジェクトとして返す。
+    指定した章について問題を 1 問生成し、Question オブジェクト（ID は qid）として返す。
     失敗した場合は None。
+    ワーカースレッドから呼ばれるので、meta_dict は読むだけにする。
+    quota は全ワーカーで共有して書き換えるが、QuotaManager は内部のロックで
+    更新を直列化しているので、そのまま呼び出してよい。
+    usage（record_usage）の更新は呼び出し側のメインスレッドで行う。
     """
     prompt = build_prompt(chapter_label, chapter_group)
 
     # 概算トークン数 (非常に大雑把で良い)
-    approx_prompt_tokens = len(prompt) // 2
+    prompt_tokens = approx_prompt_tokens(chapter_label, chapter_group)
 
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        text = response.text.strip() if hasattr(response, "text") else ""
+        model = _get_model(model_name)
+        response = model.generate_content(
+            prompt,
+            generation_config={"max_output_tokens": DEFAULT_MAX_OUTPUT_TOKENS},
+            stream=True,
+            request_options={"timeout": DEFAULT_REQUEST_TIMEOUT_SECONDS},
+        )
+        text = collect_stream_text(response)
 
-        # 出力が JSON である前提
-        data = json.loads(text)
+        # 出力が JSON である前提（コードフェンス付きも許容）
+        data = parse_response_json(text)
     except Exception as e:
         # 429 らしき場合のみクォータ推定を更新
         msg = str(e)
-        if "429" in msg or "Resource exhausted" in msg:
+        if is_quota_error(msg):
             quota.register_429(message=msg)
         else:
             quota.register_error(message=msg)
         return None
 
-    # 概算で usage に加算
+    # 実際の使用トークン数で usage に加算（取れなければ概算）
     approx_output_tokens = len(text) // 2
-    quota.add_usage(approx_prompt_tokens + approx_output_tokens)
+    quota.add_usage(usage_tokens(response, prompt_tokens + approx_output_tokens))
 
     # meta から domain / chapter_group を決定
     info = infer_domain_and_group(meta_dict, chapter_label)
     domain = info["domain"]
     chapter_group_resolved = info["chapter_group"]
 
-    # ID を生成
-    existing_ids = list(load_question_bank().keys())
-    qid = generate_question_id(chapter_label, existing_ids)
-
     created_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    # JSON から Question へマッピング
-    jq: Dict[str, Any] = {
-        "id": qid,
-        "source": "auto_refill",
-        "created_at": created_at,
-        "domain": domain,
-        "chapter_group": chapter_group_resolved,
-        "chapter_id": chapter_label,
-        "difficulty": data.get("difficulty", "standard"),
-        "question": data.get("question", "").strip(),
-        "choices": data.get("choices", []),
-        "correct_index": int(data.get("correct_index", 0)),
-        "explanation": data.get("explanation", "").strip(),
-        "syllabus": "G2024_v1.3",
-    }
-
-    # 最低限のバリデーション
-    if (
-        not jq["question"]
-        or not isinstance(jq["choices"], list)
-        or len(jq["choices"]) != 4
-    ):
-        return None
-
-    return Question.from_dict(jq)
+    # JSON から Question へマッピング（形が不正なら None）
+    return build_question(
+        data,
+        qid=qid,
+        source="auto_refill",
+        created_at=created_at,
+        domain=domain,
+        chapter_group=chapter_group_resolved,
+        chapter_id=chapter_label,
+    )
 
 
 # -------------------------------------------------------------
@@ -255,12 +240,17 @@ def refill_questions(
     count: int,
     preferred_model: Optional[str] = None,
     dry_run: bool = False,
+    workers: int = 1,
+    rpm_limit: int = DEFAULT_RPM,
 ) -> None:
     """
     問題を count 問生成してバンクに追加する。
 
     - 偏りを減らすため、MetaManager.choose_next_chapter を用いて
       出題回数の少ない章から優先的に出題
+    - workers > 1 の場合、最大 workers 問を別々の章について同時に生成する
+      （API の待ち時間を重ねる。投入は直近 1 分間の呼び出し回数が rpm_limit 未満のときだけ）
+    - 生成中の例外は 1 問の失敗として数え、残りの生成と meta の保存は続ける
     - dry_run=True の場合、生成内容を標準出力に表示するだけで
       question_bank.jsonl には書き込まない
     """
@@ -277,29 +267,92 @@ def refill_questions(
 
     model_name = choose_model_with_fallback(preferred_model)
 
-    new_questions: List[Question] = []
-
-    for _ in range(count):
-        chapter_id = mm.choose_next_chapter(available_chapter_ids=available_chapters)
-        if chapter_id is None:
-            break
-
-        info = infer_domain_and_group(mm.meta, chapter_id)
-        chapter_group = info["chapter_group"]
+    # ID の重複判定用。バンクは 1 回だけ読み、割り当てた ID も加えていく
+    used_ids = set(load_question_bank().keys())
 
-        q = generate_one_question(
-            model_name=model_name,
-            chapter_label=chapter_id,
-            chapter_group=chapter_group,
-            meta_dict=mm.meta,
-            quota=quota,
-        )
-        if q is None:
-            continue
-
-        new_questions.append(q)
-        # usage 更新（オンライン問題としてカウント）
-        mm.record_usage(chapter_id=q.chapter_id, source="online")
+    new_questions: List[Question] = []
+    # 生成中の Future → 章ラベル
+    pending: Dict[Future, str] = {}
+    submitted = 0
+    failed = 0
+    stopped = False
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        while True:
+            # 空いているワーカーに次の章を割り当てる（生成中の章は避ける）
+            rate_limited = False
+            while not stopped and submitted < count and len(pending) < max(workers, 1):
+                # 送っても 429 になるだけなので、クールダウン中は打ち切り、
+                # RPM の上限に達していれば枠が空くまで投入を待つ
+                now = time.monotonic()
+                if quota.is_blocked(now):
+                    print("Gemini のレート制限に達したため、生成を打ち切ります。")
+                    stopped = True
+                    break
+                if quota.is_rate_limited(rpm_limit, now):
+                    rate_limited = True
+                    break
+
+                busy = set(pending.values())
+                candidates = [c for c in available_chapters if c not in busy]
+                chapter_id = mm.choose_next_chapter(
+                    available_chapter_ids=candidates or available_chapters
+                )
+                if chapter_id is None:
+                    stopped = True
+                    break
+
+                info = infer_domain_and_group(mm.meta, chapter_id)
+                qid = generate_question_id(chapter_id, used_ids)
+                used_ids.add(qid)
+
+                quota.record_request(now)
+                future = pool.submit(
+                    generate_one_question,
+                    model_name=model_name,
+                    chapter_label=chapter_id,
+                    chapter_group=info["chapter_group"],
+                    meta_dict=mm.meta,
+                    quota=quota,
+                    qid=qid,
+                )
+                pending[future] = chapter_id
+                submitted += 1
+
+            if not pending:
+                if rate_limited:
+                    time.sleep(RPM_POLL_SECONDS)
+                    continue
+                break
+
+            done, _ = wait(
+                pending,
+                timeout=RPM_POLL_SECONDS if rate_limited else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                chapter_id = pending.pop(future)
+                try:
+                    q = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"{chapter_id} の生成に失敗しました: {e}")
+                    continue
+                if q is None:
+                    failed += 1
+                    # 429 を受けてクールダウン中なら、同じ API キーでの残りの生成も
+                    # 失敗するだけなので打ち切る（429 を何度も重ねて記録しない）
+                    if quota.is_blocked() and not stopped:
+                        print("Gemini のレート制限に達したため、生成を打ち切ります。")
+                        stopped = True
+                    continue
+
+                new_questions.append(q)
+                # usage 更新（オンライン問題としてカウント）
+                mm.record_usage(chapter_id=q.chapter_id, source="online")
+
+    if failed:
+        print(f"{failed}問の生成に失敗しました。")
 
     # 追記 or dry-run
     if not new_questions:
@@ -344,6 +397,18 @@ def main() -> None:
         action="store_true",
         help="問題バンクには書き込まず、生成結果のみ標準出力に表示する",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="同時に生成する問題数（デフォルト: 1 = 1 問ずつ順番に生成）",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=DEFAULT_RPM,
+        help=f"1 分あたりの Gemini 呼び出し回数の上限（デフォルト: {DEFAULT_RPM}、0 以下で無制限）",
+    )
     args = parser.parse_args()
 
     init_gemini()
@@ -351,6 +416,8 @@ def main() -> None:
         count=args.count,
         preferred_model=args.model,
         dry_run=args.dry_run,
+        workers=args.workers,
+        rpm_limit=args.rpm,
     )
 
 